@@ -87,3 +87,36 @@ module "visualization_table" {
     Environment = var.environment
   }
 }
+
+# Productivity pipeline state table
+# Generic key/value store shared by the Todoist workflow lambdas (see src/lambda/state_store.py):
+# - pk (S): Primary key - "<namespace>#<key>", e.g. "todoist_sync#state", "todoist_sync_tasks#<task id>"
+# - value (S): JSON encoded value
+# - updatedAt (N): Last write timestamp
+# - expiry (N): Optional TTL timestamp
+module "pipeline_state_table" {
+  source = "./modules/dynamodb"
+
+  environment = var.environment
+  table_name  = "${var.project_name}-pipeline-state-${var.environment}"
+  hash_key    = "pk"
+
+  attributes = [
+    {
+      name = "pk"
+      type = "S"
+    }
+  ]
+
+  billing_mode = var.dynamodb_billing_mode
+
+  enable_point_in_time_recovery = false
+  ttl_enabled                   = true
+  ttl_attribute                 = "expiry"
+
+  tags = {
+    Component   = "Productivity System"
+    Name        = "Pipeline State Table"
+    Environment = var.environment
+  }
+}
@@ -9,6 +9,9 @@
 # - lastUpdatedBy (S): User identifier who last updated
 # - userId (S): User who owns the visualization
 # - lastUpdatedAt (N): Last update timestamp (redundant with timestamp but more explicit)
+# Each paramId also has a head item at timestamp 0 holding versionNumber (N) and the
+# current mean/stdDev; updates advance it conditionally in the same transaction as the
+# new row and its history, so concurrent writers cannot both claim a version.
 module "parameter_table" {
   source = "./modules/dynamodb"
 
@@ -133,6 +136,7 @@ module "history_table" {
 # - expiry (N): TTL timestamp for connection expiration
 # - connectionStatus (S): Status of the connection (connected, disconnected)
 # - clientIp (S): Client IP address for diagnostics
+# - paramId (S): Parameter set the connection subscribes to (used in GSI)
 module "connection_table" {
   source = "./modules/dynamodb"
 
@@ -148,6 +152,10 @@ module "connection_table" {
     {
       name = "userId"
       type = "S"
+    },
+    {
+      name = "paramId"
+      type = "S"
     }
   ]
 
@@ -161,6 +169,16 @@ module "connection_table" {
       read_capacity      = 5
       projection_type    = "ALL"
       non_key_attributes = []
+    },
+    # Subscribers of a parameter set, queried by targeted broadcasts
+    {
+      name               = "ParamIdIndex"
+      hash_key           = "paramId"
+      range_key          = "connectionId"
+      write_capacity     = 5
+      read_capacity      = 5
+      projection_type    = "KEYS_ONLY"
+      non_key_attributes = []
     }
   ]
 
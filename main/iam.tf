@@ -153,6 +153,12 @@ resource "aws_iam_role_policy" "sfn_policy" {
         Effect   = "Allow"
         Resource = "*"
       },
+      # Child executions of a DISTRIBUTED Map state in the Todoist workflow
+      {
+        Action   = ["states:DescribeExecution", "states:StopExecution"]
+        Effect   = "Allow"
+        Resource = "*"
+      },
       {
         Action   = ["logs:CreateLogStream", "logs:PutLogEvents"]
         Effect   = "Allow"
@@ -8,11 +8,42 @@ locals {
       actions   = ["s3:PutObject", "s3:GetObject"]
       resources = ["${aws_s3_bucket.wyatt-datalake-35315550.arn}/*"]
     }
+    s3_datalake_kms = {
+      effect    = "Allow"
+      actions   = ["kms:GenerateDataKey", "kms:Decrypt"]
+      resources = [aws_kms_key.s3_key.arn]
+    }
+  }
+
+  # Shared key/value state (sync tokens, caches, indexes) for the productivity lambdas
+  pipeline_state_policy = {
+    pipeline_state = {
+      effect    = "Allow"
+      actions   = ["dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:DeleteItem", "dynamodb:BatchGetItem", "dynamodb:BatchWriteItem"]
+      resources = [module.pipeline_state_table.table_arn]
+    }
+  }
+
+  # Every lambda container keeps its own rate limiters (TokenBucket in src/lambda),
+  # and the Map state runs up to todoist_workflow_max_concurrency chunks at once, one
+  # stage per chunk at a time. Each container therefore gets an equal share of the
+  # account-wide OpenAI and Notion budgets. putChatGPT writes to Notion too when it
+  # streams completions, so both lambdas share the Notion budget.
+  todoist_workflow_parallelism = var.todoist_workflow_chunk_size > 0 ? var.todoist_workflow_max_concurrency : 1
+  openai_rate_env_vars = {
+    OPENAI_RPM_LIMIT = max(1, floor(var.openai_rpm_limit / local.todoist_workflow_parallelism))
+    OPENAI_TPM_LIMIT = max(1, floor(var.openai_tpm_limit / local.todoist_workflow_parallelism))
+  }
+  notion_rate_env_vars = {
+    NOTION_REQUESTS_PER_SECOND = var.notion_requests_per_second / local.todoist_workflow_parallelism
   }
 
   # Common environment variables
   common_env_vars = {
-    S3_BUCKET_NAME = aws_s3_bucket.wyatt-datalake-35315550.bucket
+    S3_BUCKET_NAME       = aws_s3_bucket.wyatt-datalake-35315550.bucket
+    PIPELINE_STATE_TABLE = module.pipeline_state_table.table_id
+    # Claim-check store for task batches too large to pass through Step Functions
+    PIPELINE_PAYLOAD_BUCKET = aws_s3_bucket.wyatt-datalake-35315550.bucket
   }
 }
 
@@ -27,9 +58,12 @@ module "todoist_lambda" {
   zip_file         = local.lambda_zip_path
   create_log_group = false
 
-  environment_variables = local.common_env_vars
+  environment_variables = merge(local.common_env_vars, {
+    TODOIST_SYNC_MODE   = "incremental"
+    PIPELINE_CHUNK_SIZE = var.todoist_workflow_chunk_size
+  })
 
-  policy_statements = merge(local.s3_datalake_policy, {
+  policy_statements = merge(local.s3_datalake_policy, local.pipeline_state_policy, {
     logs = {
       effect    = "Allow"
       actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -59,9 +93,9 @@ module "chatgpt_lambda" {
   zip_file         = local.lambda_zip_path
   create_log_group = false
 
-  environment_variables = local.common_env_vars
+  environment_variables = merge(local.common_env_vars, local.openai_rate_env_vars, local.notion_rate_env_vars)
 
-  policy_statements = merge(local.s3_datalake_policy, {
+  policy_statements = merge(local.s3_datalake_policy, local.pipeline_state_policy, {
     logs = {
       effect    = "Allow"
       actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -91,9 +125,9 @@ module "notion_lambda" {
   zip_file         = local.lambda_zip_path
   create_log_group = false
 
-  environment_variables = local.common_env_vars
+  environment_variables = merge(local.common_env_vars, local.notion_rate_env_vars)
 
-  policy_statements = merge(local.s3_datalake_policy, {
+  policy_statements = merge(local.s3_datalake_policy, local.pipeline_state_policy, {
     logs = {
       effect    = "Allow"
       actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -125,7 +159,7 @@ module "put_todoist_lambda" {
 
   environment_variables = local.common_env_vars
 
-  policy_statements = merge(local.s3_datalake_policy, {
+  policy_statements = merge(local.s3_datalake_policy, local.pipeline_state_policy, {
     logs = {
       effect    = "Allow"
       actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -47,6 +47,88 @@ module "get_visualization_lambda" {
   }
 }
 
+# Distribution curve Lambda: sampled PDF/CDF for a parameter set, as JSON or float32 binary
+module "get_curve_lambda" {
+  source = "./modules/lambda_function"
+
+  environment   = var.environment
+  function_name = "${local.function_prefix}-curve-${local.env_suffix}"
+  description   = "Lambda function to compute normal distribution curves"
+  handler       = "visualization/getVisualizationCurve.lambda_handler"
+  runtime       = "python3.12"
+  timeout       = 10
+  memory_size   = 256
+  zip_file      = local.lambda_viz_zip_path
+
+  environment_variables = {
+    PARAMETER_TABLE = module.parameter_table.table_id
+  }
+
+  policy_statements = {
+    dynamodb = {
+      effect  = "Allow"
+      actions = ["dynamodb:Query", "dynamodb:GetItem"]
+      resources = [
+        module.parameter_table.table_arn
+      ]
+    },
+    logs = {
+      effect    = "Allow"
+      actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
+      resources = ["arn:aws:logs:*:*:*"]
+    }
+  }
+
+  tags = {
+    Component   = "D3 Dashboard"
+    Function    = "Get Visualization Curve"
+    Environment = var.environment
+  }
+}
+
+# List parameter sets and change history Lambda (paginated)
+module "list_visualization_lambda" {
+  source = "./modules/lambda_function"
+
+  environment   = var.environment
+  function_name = "${local.function_prefix}-list-${local.env_suffix}"
+  description   = "Lambda function to page through parameter sets and change history"
+  handler       = "visualization/listVisualizationData.lambda_handler"
+  runtime       = "python3.12"
+  timeout       = 10
+  zip_file      = local.lambda_viz_zip_path
+
+  environment_variables = {
+    PARAMETER_TABLE = module.parameter_table.table_id
+    HISTORY_TABLE   = module.history_table.table_id
+  }
+
+  policy_statements = {
+    dynamodb = {
+      effect  = "Allow"
+      actions = ["dynamodb:Query"]
+      resources = [
+        module.parameter_table.table_arn,
+        "${module.parameter_table.table_arn}/index/UserIdIndex",
+        module.history_table.table_arn,
+        "${module.history_table.table_arn}/index/ParamIdIndex",
+        "${module.history_table.table_arn}/index/ParamNameIndex"
+      ]
+    },
+    logs = {
+      effect    = "Allow"
+      actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
+      resources = ["arn:aws:logs:*:*:*"]
+    }
+  }
+
+  tags = {
+    Component   = "D3 Dashboard"
+    Function    = "List Visualization Data"
+    Environment = var.environment
+  }
+}
+
 # Update visualization data Lambda
 module "update_visualization_lambda" {
   source = "./modules/lambda_function"
@@ -64,16 +146,19 @@ module "update_visualization_lambda" {
     HISTORY_TABLE          = module.history_table.table_id
     CONNECTION_TABLE       = module.connection_table.table_id
     WEBSOCKET_API_ENDPOINT = aws_apigatewayv2_stage.websocket.invoke_url
+    BROADCAST_MODE         = "async"
+    BROADCAST_QUEUE_URL    = aws_sqs_queue.broadcast.url
   }
 
   policy_statements = {
     dynamodb = {
       effect  = "Allow"
-      actions = ["dynamodb:Query", "dynamodb:Scan", "dynamodb:GetItem", "dynamodb:PutItem"]
+      actions = ["dynamodb:Query", "dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:ConditionCheckItem", "dynamodb:DeleteItem", "dynamodb:BatchWriteItem"]
       resources = [
         module.parameter_table.table_arn,
         module.history_table.table_arn,
-        module.connection_table.table_arn
+        module.connection_table.table_arn,
+        "${module.connection_table.table_arn}/index/ParamIdIndex"
       ]
     },
     websocket = {
@@ -81,6 +166,11 @@ module "update_visualization_lambda" {
       actions   = ["execute-api:ManageConnections"]
       resources = ["${aws_apigatewayv2_api.websocket.execution_arn}/*"]
     },
+    broadcast_queue = {
+      effect    = "Allow"
+      actions   = ["sqs:SendMessage"]
+      resources = [aws_sqs_queue.broadcast.arn]
+    },
     logs = {
       effect    = "Allow"
       actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -95,6 +185,78 @@ module "update_visualization_lambda" {
   }
 }
 
+# Queue of parameter update broadcasts, filled by the update Lambda
+resource "aws_sqs_queue" "broadcast" {
+  name                       = "${local.function_prefix}-broadcast-${local.env_suffix}"
+  visibility_timeout_seconds = 60
+  message_retention_seconds  = 300
+
+  tags = {
+    Component   = "D3 Dashboard"
+    Name        = "Broadcast Queue"
+    Environment = var.environment
+  }
+}
+
+# Broadcaster Lambda: pushes queued parameter updates to WebSocket subscribers
+module "broadcast_lambda" {
+  source = "./modules/lambda_function"
+
+  environment   = var.environment
+  function_name = "${local.function_prefix}-broadcast-${local.env_suffix}"
+  description   = "Lambda function to broadcast parameter updates to WebSocket clients"
+  handler       = "visualization/broadcastParams.lambda_handler"
+  runtime       = "python3.12"
+  timeout       = 30
+  zip_file      = local.lambda_viz_zip_path
+
+  environment_variables = {
+    CONNECTION_TABLE       = module.connection_table.table_id
+    WEBSOCKET_API_ENDPOINT = aws_apigatewayv2_stage.websocket.invoke_url
+  }
+
+  policy_statements = {
+    dynamodb = {
+      effect  = "Allow"
+      actions = ["dynamodb:Query", "dynamodb:DeleteItem", "dynamodb:BatchWriteItem"]
+      resources = [
+        module.connection_table.table_arn,
+        "${module.connection_table.table_arn}/index/ParamIdIndex"
+      ]
+    },
+    sqs = {
+      effect    = "Allow"
+      actions   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"]
+      resources = [aws_sqs_queue.broadcast.arn]
+    },
+    websocket = {
+      effect    = "Allow"
+      actions   = ["execute-api:ManageConnections"]
+      resources = ["${aws_apigatewayv2_api.websocket.execution_arn}/*"]
+    },
+    logs = {
+      effect    = "Allow"
+      actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
+      resources = ["arn:aws:logs:*:*:*"]
+    }
+  }
+
+  tags = {
+    Component   = "D3 Dashboard"
+    Function    = "Broadcast Parameter Updates"
+    Environment = var.environment
+  }
+}
+
+# Batching window lets rapid updates to the same paramId be coalesced into one push
+resource "aws_lambda_event_source_mapping" "broadcast" {
+  event_source_arn                   = aws_sqs_queue.broadcast.arn
+  function_name                      = module.broadcast_lambda.function_name
+  batch_size                         = 50
+  maximum_batching_window_in_seconds = 1
+  function_response_types            = ["ReportBatchItemFailures"]
+}
+
 # WebSocket Connect Lambda
 module "ws_connect_lambda" {
   source = "./modules/lambda_function"
@@ -152,7 +314,7 @@ module "ws_disconnect_lambda" {
   policy_statements = {
     dynamodb = {
       effect  = "Allow"
-      actions = ["dynamodb:DeleteItem"]
+      actions = ["dynamodb:GetItem", "dynamodb:DeleteItem"]
       resources = [
         module.connection_table.table_arn
       ]
@@ -14,6 +14,25 @@ resource "aws_s3_bucket_public_access_block" "wyatt_datalake_35315550" {
   restrict_public_buckets = true
 }
 
+# Claim-check payloads handed between the Todoist workflow lambdas are only read
+# by the next stage, so expire them once any retried execution is long finished
+resource "aws_s3_bucket_lifecycle_configuration" "wyatt_datalake_35315550" {
+  bucket = aws_s3_bucket.wyatt-datalake-35315550.id
+
+  rule {
+    id     = "expire-pipeline-payloads"
+    status = "Enabled"
+
+    filter {
+      prefix = "pipeline-payloads/"
+    }
+
+    expiration {
+      days = 2
+    }
+  }
+}
+
 # Create KMS key for S3 encryption
 resource "aws_kms_key" "s3_key" {
   description             = "KMS key for S3 bucket encryption"
@@ -1,3 +1,120 @@
+locals {
+  todoist_stage_retry = [
+    {
+      ErrorEquals : ["States.TaskFailed"],
+      IntervalSeconds : 3,
+      MaxAttempts : 2,
+      BackoffRate : 1.5
+    }
+  ]
+
+  # Each stage returns {statusCode, body, summary}. body is either the inline
+  # JSON task array or a claim check pointing at the batch in the datalake
+  # bucket (see dump_tasks in src/lambda/utils.py); summary.count is the
+  # number of tasks in it.
+  todoist_fetch_states = {
+    GetIncompleteTasks : {
+      Type : "Task",
+      Resource : module.todoist_lambda.function_arn,
+      Next : "HasTasks",
+      Retry : local.todoist_stage_retry
+    },
+    HasTasks : {
+      Type : "Choice",
+      Choices : [
+        {
+          And : [
+            { Variable : "$.summary.count", IsPresent : true },
+            { Variable : "$.summary.count", NumericEquals : 0 }
+          ],
+          Next : "NoTasks"
+        }
+      ],
+      Default : var.todoist_workflow_chunk_size > 0 ? "ProcessChunks" : "PutChatGPT"
+    },
+    NoTasks : {
+      Type : "Succeed"
+    }
+  }
+
+  # Whole batch through each lambda in turn (todoist_workflow_chunk_size = 0)
+  todoist_batch_states = {
+    PutChatGPT : {
+      Type : "Task",
+      Resource : module.chatgpt_lambda.function_arn,
+      Next : "PutNotion",
+      Retry : local.todoist_stage_retry
+    },
+    PutNotion : {
+      Type : "Task",
+      Resource : module.notion_lambda.function_arn,
+      Next : "PutTodoist",
+      Retry : local.todoist_stage_retry
+    },
+    PutTodoist : {
+      Type : "Task",
+      Resource : module.put_todoist_lambda.function_arn,
+      End : true,
+      Retry : local.todoist_stage_retry
+    }
+  }
+
+  todoist_map_processor_config = {
+    INLINE      = { Mode = "INLINE" }
+    DISTRIBUTED = { Mode = "DISTRIBUTED", ExecutionType = "STANDARD" }
+  }
+
+  # getTodoist splits the batch into chunks of PIPELINE_CHUNK_SIZE tasks and each
+  # chunk runs the remaining stages on its own. In chunk mode a handler raises
+  # when any of its tasks fails, so only that chunk is retried; tasks that already
+  # succeeded are skipped on retry by the completion cache, the Notion index and
+  # the deterministic close uuids. A chunk that still fails is recorded and its
+  # tasks stay open in Todoist for the next run.
+  todoist_map_states = {
+    ProcessChunks : {
+      Type : "Map",
+      ItemsPath : "$.chunks",
+      MaxConcurrency : var.todoist_workflow_max_concurrency,
+      End : true,
+      ItemProcessor : {
+        ProcessorConfig : local.todoist_map_processor_config[var.todoist_workflow_map_mode],
+        StartAt : "PutChatGPT",
+        States : {
+          PutChatGPT : {
+            Type : "Task",
+            Resource : module.chatgpt_lambda.function_arn,
+            Next : "PutNotion",
+            Retry : local.todoist_stage_retry,
+            Catch : [{ ErrorEquals : ["States.ALL"], ResultPath : "$.error", Next : "ChunkFailed" }]
+          },
+          PutNotion : {
+            Type : "Task",
+            Resource : module.notion_lambda.function_arn,
+            Next : "PutTodoist",
+            Retry : local.todoist_stage_retry,
+            Catch : [{ ErrorEquals : ["States.ALL"], ResultPath : "$.error", Next : "ChunkFailed" }]
+          },
+          PutTodoist : {
+            Type : "Task",
+            Resource : module.put_todoist_lambda.function_arn,
+            End : true,
+            Retry : local.todoist_stage_retry,
+            Catch : [{ ErrorEquals : ["States.ALL"], ResultPath : "$.error", Next : "ChunkFailed" }]
+          },
+          ChunkFailed : {
+            Type : "Pass",
+            Parameters : {
+              "chunk.$" : "$.chunk",
+              "error.$" : "$.error"
+            },
+            End : true
+          }
+        }
+      }
+    }
+  }
+}
+
 module "todoist_workflow" {
   source = "./modules/step_function"
 
@@ -8,60 +125,7 @@ module "todoist_workflow" {
   definition = jsonencode({
     Comment : "Todoist task enrichment workflow with ChatGPT and Notion integration",
     StartAt : "GetIncompleteTasks",
-    States : {
-      GetIncompleteTasks : {
-        Type : "Task",
-        Resource : module.todoist_lambda.function_arn,
-        Next : "PutChatGPT",
-        Retry : [
-          {
-            ErrorEquals : ["States.TaskFailed"],
-            IntervalSeconds : 3,
-            MaxAttempts : 2,
-            BackoffRate : 1.5
-          }
-        ]
-      },
-      PutChatGPT : {
-        Type : "Task",
-        Resource : module.chatgpt_lambda.function_arn,
-        Next : "PutNotion",
-        Retry : [
-          {
-            ErrorEquals : ["States.TaskFailed"],
-            IntervalSeconds : 3,
-            MaxAttempts : 2,
-            BackoffRate : 1.5
-          }
-        ]
-      },
-      PutNotion : {
-        Type : "Task",
-        Resource : module.notion_lambda.function_arn,
-        Next : "PutTodoist",
-        Retry : [
-          {
-            ErrorEquals : ["States.TaskFailed"],
-            IntervalSeconds : 3,
-            MaxAttempts : 2,
-            BackoffRate : 1.5
-          }
-        ]
-      },
-      PutTodoist : {
-        Type : "Task",
-        Resource : module.put_todoist_lambda.function_arn,
-        End : true,
-        Retry : [
-          {
-            ErrorEquals : ["States.TaskFailed"],
-            IntervalSeconds : 3,
-            MaxAttempts : 2,
-            BackoffRate : 1.5
-          }
-        ]
-      }
-    }
+    States : merge(local.todoist_fetch_states, { batch = local.todoist_batch_states, map = local.todoist_map_states }[var.todoist_workflow_chunk_size > 0 ? "map" : "batch"])
   })
 
   tags = {
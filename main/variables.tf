@@ -112,6 +112,46 @@ variable "step_function_name" {
   default     = "todoist-workflow"
 }
 
+variable "todoist_workflow_chunk_size" {
+  description = "Tasks per Map-state chunk in the Todoist workflow (0 runs the whole batch through each lambda in turn)"
+  type        = number
+  default     = 5
+}
+
+variable "todoist_workflow_max_concurrency" {
+  description = "Maximum number of Todoist workflow chunks processed in parallel"
+  type        = number
+  default     = 4
+}
+
+variable "todoist_workflow_map_mode" {
+  description = "Map state processing mode for the Todoist workflow (INLINE or DISTRIBUTED)"
+  type        = string
+  default     = "INLINE"
+  validation {
+    condition     = contains(["INLINE", "DISTRIBUTED"], var.todoist_workflow_map_mode)
+    error_message = "Allowed values for todoist_workflow_map_mode are \"INLINE\" or \"DISTRIBUTED\"."
+  }
+}
+
+variable "openai_rpm_limit" {
+  description = "OpenAI requests per minute available to the Todoist workflow, split across its parallel chunks"
+  type        = number
+  default     = 500
+}
+
+variable "openai_tpm_limit" {
+  description = "OpenAI tokens per minute available to the Todoist workflow, split across its parallel chunks"
+  type        = number
+  default     = 30000
+}
+
+variable "notion_requests_per_second" {
+  description = "Notion requests per second available to the Todoist workflow, split across its parallel chunks"
+  type        = number
+  default     = 3
+}
+
 variable "lambda_sg_name" {
   description = "Name for the Lambda security group"
   type        = string
@@ -0,0 +1,39 @@
+"""Process-wide boto3 clients, reused across warm invocations.
+
+Kept apart from utils so the state and payload stores, which utils imports,
+can share the same clients.
+"""
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from instrumentation import metrics
+
+# Connection pools of the shared clients: sized for the handlers' worker threads,
+# kept alive between warm invocations so they skip the TCP/TLS handshake
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))
+
+_boto_session = None
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None):
+    """Return a shared boto3 client, building it on first use in this container.
+
+    ``region_name=None`` uses the region of the environment (AWS_REGION on Lambda).
+    """
+    global _boto_session
+    key = (service_name, region_name)
+    with _clients_lock:
+        if key not in _clients:
+            if _boto_session is None:
+                _boto_session = boto3.session.Session()
+            config = Config(max_pool_connections=HTTP_POOL_SIZE, tcp_keepalive=True, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT, retries={"mode": "standard"})
+            with metrics.phase("client_init"):
+                _clients[key] = _boto_session.client(service_name=service_name, region_name=region_name, config=config)
+        return _clients[key]
@@ -0,0 +1,103 @@
+"""Summarise the EMF phase timings printed by instrumentation.Metrics.
+
+Reads CloudWatch log exports (``aws logs tail``, ``aws logs filter-log-events``
+text output, or saved benchmark stdout) and finds the JSON metric lines, plus the
+Lambda ``REPORT`` lines for billed duration, memory and init duration. Prints, per
+function and metric, the count and p50/p95/p99/max, with cold and warm invocations
+reported separately.
+
+Usage:
+    aws logs tail /aws/lambda/putChatGPT --since 1d > putChatGPT.log
+    python src/lambda/benchmarks/aggregate_metrics.py putChatGPT.log
+    python src/lambda/benchmarks/aggregate_metrics.py --json summary.json *.log
+    cat bench_stdout.txt | python src/lambda/benchmarks/aggregate_metrics.py
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+REPORT_PATTERN = re.compile(r"REPORT RequestId:.*?Duration: (?P<duration>[\d.]+) ms.*?Billed Duration: (?P<billed>[\d.]+) ms.*?Max Memory Used: (?P<memory>\d+) MB(?:.*?Init Duration: (?P<init>[\d.]+) ms)?")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_lines(lines, report_function):
+    """Yield ``(function, cold_start, {metric: value})`` for every metric or REPORT line."""
+    for line in lines:
+        start = line.find('{"')
+        if start != -1 and '"_aws"' in line:
+            try:
+                record = json.loads(line[start:])
+            except ValueError:
+                continue
+            values = {name: value for name, value in record.items() if isinstance(value, (int, float)) and not isinstance(value, bool)}
+            yield record.get("FunctionName", "unknown"), bool(record.get("ColdStart")), values
+            continue
+
+        match = REPORT_PATTERN.search(line)
+        if match:
+            values = {"lambda.duration_ms": float(match["duration"]), "lambda.billed_ms": float(match["billed"]), "lambda.max_memory_mb": int(match["memory"])}
+            if match["init"]:
+                values["lambda.init_ms"] = float(match["init"])
+            yield report_function, match["init"] is not None, values
+
+
+def aggregate(records):
+    """{function: {"cold"|"warm": {metric: [values]}}}"""
+    summary = {}
+    for function, cold_start, values in records:
+        bucket = summary.setdefault(function, {}).setdefault("cold" if cold_start else "warm", {})
+        for name, value in values.items():
+            bucket.setdefault(name, []).append(value)
+    return summary
+
+
+def report(summary):
+    result = {}
+    for function in sorted(summary):
+        for start in ("cold", "warm"):
+            metrics = summary[function].get(start)
+            if not metrics:
+                continue
+            invocations = max(len(values) for values in metrics.values())
+            print(f"\n{function} ({start}, {invocations} invocations)")
+            print(f"{'metric':<32}{'n':>6}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}")
+            for name in sorted(metrics):
+                values = metrics[name]
+                p50, p95, p99 = (percentile(values, pct) for pct in (50, 95, 99))
+                print(f"{name:<32}{len(values):>6}{p50:>11.1f}{p95:>11.1f}{p99:>11.1f}{max(values):>11.1f}")
+                result.setdefault(function, {}).setdefault(start, {})[name] = {"n": len(values), "p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="log files (default: stdin)")
+    parser.add_argument("--function", help="function name for REPORT lines (default: the log file name)")
+    parser.add_argument("--json", dest="json_path", help="also write the summary as JSON")
+    args = parser.parse_args()
+
+    records = []
+    if args.paths:
+        for path in args.paths:
+            with open(path) as file:
+                report_function = args.function or os.path.splitext(os.path.basename(path))[0]
+                records.extend(parse_lines(file, report_function))
+    else:
+        records.extend(parse_lines(sys.stdin, args.function or "lambda"))
+
+    result = report(aggregate(records))
+    if args.json_path:
+        with open(args.json_path, "w") as file:
+            json.dump(result, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
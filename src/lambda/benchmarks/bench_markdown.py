@@ -0,0 +1,68 @@
+"""Micro-benchmark for utils.markdown_to_notion_blocks on large gpt-4o style outputs.
+
+Usage: python src/lambda/benchmarks/bench_markdown.py [--sizes 1000 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import markdown_to_notion_blocks  # noqa: E402
+
+SECTION = """## Acceptance Criteria {n}
+
+1. **Pipeline Development** for item {n}
+   - Create a new pipeline with *italic* notes and `inline_code()`.
+   - See [the docs](https://example.com/docs/{n}) for details.
+     - Nested detail with **bold** text.
+
+2. **Data Integration**
+   - Validate and clean existing data before integration.
+
+```python
+def step_{n}():
+    return {n}
+```
+
+Plain paragraph text describing section {n} with enough words to look like a real completion.
+"""
+
+
+def make_markdown(n_lines):
+    lines_per_section = SECTION.count("\n")
+    return "".join(SECTION.format(n=i) for i in range(max(1, n_lines // lines_per_section)))
+
+
+def run(n_lines, repeat):
+    markdown = make_markdown(n_lines)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        blocks = markdown_to_notion_blocks(markdown)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    markdown_to_notion_blocks(markdown)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(timings)
+    line_count = markdown.count("\n")
+    print(f"{line_count:>8} lines {len(markdown) / 1024:>9.1f} KiB {len(blocks):>7} blocks  best {best * 1000:>9.2f} ms  {line_count / best:>11.0f} lines/s  peak {peak / 1024 / 1024:>7.2f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for n_lines in args.sizes:
+        run(n_lines, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Replay task batches through the Todoist -> ChatGPT -> Notion -> Todoist handlers.
+
+Every stage runs its real lambda_handler against the local fakes in fakes.py, with
+injected latency and error rates. For each batch size the pipeline is run --runs
+times (warm container, fresh pipeline state per run) and the report shows per-stage
+latency percentiles, throughput and, from one extra traced run, peak memory.
+
+Usage:
+    python src/lambda/benchmarks/bench_pipeline.py --sizes 10 100 1000
+    python src/lambda/benchmarks/bench_pipeline.py --replay recorded_body.json --runs 3
+    python src/lambda/benchmarks/bench_pipeline.py --openai-latency-ms 800 --notion-error-rate 0.02 --json out.json
+    python src/lambda/benchmarks/bench_pipeline.py --metrics-log run.log && python src/lambda/benchmarks/aggregate_metrics.py run.log
+    python src/lambda/benchmarks/bench_pipeline.py --openai-token-ms 5 --streaming
+
+"first content" is the time from the start of the pipeline until a Work page (the
+pages that show agent_output) first receives blocks.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PROMPTS_DIR = os.path.join(LAMBDA_DIR, "..", "system_prompts")
+sys.path.insert(0, LAMBDA_DIR)
+
+from fakes import FakeServices, ServiceProfile, make_task_items, rest_task_to_item  # noqa: E402
+
+STAGES = ["getTodoist", "putChatGPT", "putNotion", "putTodoist"]
+SECRETS = {
+    "todoist_key": {"TODOIST_API_KEY": "fake-todoist"},
+    "open_ai_key": {"OPEN_AI_KEY": "fake-openai"},
+    "notion_token": {"NOTION_API_TOKEN": "fake-notion"},
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def prepare_workdir():
+    """Mirror the flat deployment package layout (config.json and prompts in the cwd)."""
+    workdir = tempfile.mkdtemp(prefix="bench_pipeline_")
+    shutil.copy(os.path.join(LAMBDA_DIR, "config.json"), workdir)
+    for name in os.listdir(PROMPTS_DIR):
+        shutil.copy(os.path.join(PROMPTS_DIR, name), workdir)
+    return workdir
+
+
+def run_pipeline(handlers, fakes, items, trace_memory=False, log=None):
+    """Run all four stages once.
+
+    Returns ``{stage: (seconds, peak_bytes, status, error)}`` and the seconds from
+    the start of the run to the first content of each Notion page.
+
+    The handlers' stdout (including their metric lines) is appended to ``log`` if given.
+    """
+    # Fresh state per run: empty sync mirror, completion cache and Notion index
+    os.environ["PIPELINE_STATE_DIR"] = tempfile.mkdtemp(prefix="state_", dir=os.getcwd())
+    fakes.load_items({**item, "checked": False} for item in items)
+    fakes.state.first_content.clear()
+    fakes.state.pages.clear()
+    started = time.perf_counter()
+
+    results = {}
+    event = {"time": "2024-06-12T11:00:00Z", "source": "aws.events"}
+    for stage in STAGES:
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        error = None
+        output = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(output):
+                response = handlers[stage](event, None)
+        except Exception as exc:  # noqa: BLE001
+            response = {"statusCode": None, "body": "[]"}
+            error = repr(exc)
+        elapsed = time.perf_counter() - start
+        if log is not None:
+            log.write(output.getvalue())
+        peak = 0
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[stage] = (elapsed, peak, response.get("statusCode"), error)
+        event = {"statusCode": response.get("statusCode"), "body": response.get("body", "[]")}
+    work_pages = [page_id for page_id, page in fakes.state.pages.items() if page.get("properties", {}).get("Team", {}).get("select", {}).get("name") == "Work"]
+    return results, [fakes.state.first_content[page_id] - started for page_id in work_pages if page_id in fakes.state.first_content]
+
+
+def report(n_tasks, samples, peaks, failures, first_content):
+    print(f"\n{n_tasks} tasks")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'tasks/s':>11}{'peak MiB':>10}{'failed':>8}")
+    summary = {}
+    for stage in STAGES + ["total"]:
+        values = samples[stage]
+        p50, p95, p99 = (percentile(values, pct) for pct in (50, 95, 99))
+        throughput = n_tasks / p50 if p50 else float("inf")
+        peak = peaks.get(stage, 0) / 1024 / 1024
+        print(f"{stage:<12}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{p99 * 1000:>10.1f}{throughput:>11.1f}{peak:>10.2f}{failures.get(stage, 0):>8}")
+        summary[stage] = {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000, "tasks_per_s": throughput, "peak_mib": peak, "failed_runs": failures.get(stage, 0)}
+    if first_content:
+        p50, p95, p99 = (percentile(first_content, pct) for pct in (50, 95, 99))
+        print(f"{'first content':<12}{p50 * 1000:>10.1f}{p95 * 1000:>10.1f}{p99 * 1000:>10.1f}{'':>11}{'':>10}{len(first_content):>8} pages")
+        summary["first_content"] = {"p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "p99_ms": p99 * 1000, "pages": len(first_content)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--replay", help="JSON file with a recorded task batch (a getTodoist response body)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", dest="json_path", help="also write the summary as JSON")
+    parser.add_argument("--metrics-log", help="write the handlers' output (with metric lines) to this file")
+    parser.add_argument("--streaming", action="store_true", help="stream completions into Notion pages (OPENAI_STREAMING=1)")
+    parser.add_argument("--openai-token-ms", type=float, default=0.0, help="fake generation time per ~4 character token")
+    for service, latency in (("todoist", 50), ("openai", 300), ("notion", 100), ("secretsmanager", 20)):
+        parser.add_argument(f"--{service}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+        parser.add_argument(f"--{service}-rate-limit-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    profiles = {service: ServiceProfile(latency_ms=getattr(args, f"{service}_latency_ms"), jitter_ms=getattr(args, f"{service}_latency_ms") * 0.2, error_rate=getattr(args, f"{service}_error_rate"), rate_limit_rate=getattr(args, f"{service}_rate_limit_rate")) for service in ("todoist", "openai", "notion", "secretsmanager")}
+    profiles["openai"].token_ms = args.openai_token_ms
+
+    replay_path = os.path.abspath(args.replay) if args.replay else None
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    metrics_log = open(os.path.abspath(args.metrics_log), "w") if args.metrics_log else None
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    with open("config.json") as file:
+        config = json.load(file)
+    project_ids = [project["project_id"] for project in config["projects"]]
+    section_ids = [section["section_id"] for section in config["sections"]]
+
+    batches = []
+    if replay_path:
+        with open(replay_path) as file:
+            recorded = json.load(file)
+        batches.append([rest_task_to_item(task) for task in recorded])
+    else:
+        batches.extend(make_task_items(n_tasks, project_ids, section_ids, seed=n_tasks) for n_tasks in args.sizes)
+
+    with FakeServices(profiles=profiles, secrets=SECRETS) as fakes:
+        os.environ.update(fakes.environ())
+        os.environ.pop("PIPELINE_STATE_TABLE", None)
+        os.environ["TODOIST_SYNC_MODE"] = "incremental"
+        os.environ["OPENAI_STREAMING"] = "1" if args.streaming else "0"
+        # The fakes are not rate limited, so lift the client-side budgets
+        os.environ.setdefault("OPENAI_RPM_LIMIT", "1000000")
+        os.environ.setdefault("OPENAI_TPM_LIMIT", "1000000000")
+        os.environ.setdefault("NOTION_REQUESTS_PER_SECOND", "1000")
+
+        import getTodoist
+        import putChatGPT
+        import putNotion
+        import putTodoist
+
+        handlers = {"getTodoist": getTodoist.lambda_handler, "putChatGPT": putChatGPT.lambda_handler, "putNotion": putNotion.lambda_handler, "putTodoist": putTodoist.lambda_handler}
+
+        summaries = {}
+        for items in batches:
+            fakes.state.items.clear()
+            fakes.state.item_versions.clear()
+            samples = {stage: [] for stage in STAGES + ["total"]}
+            failures = {}
+            first_content = []
+            for _ in range(args.runs):
+                results, page_times = run_pipeline(handlers, fakes, items, log=metrics_log)
+                first_content.extend(page_times)
+                for stage, (elapsed, _, status, error) in results.items():
+                    samples[stage].append(elapsed)
+                    if error or status != 200:
+                        failures[stage] = failures.get(stage, 0) + 1
+                samples["total"].append(sum(result[0] for result in results.values()))
+            traced, _ = run_pipeline(handlers, fakes, items, trace_memory=True)
+            peaks = {stage: result[1] for stage, result in traced.items()}
+            peaks["total"] = max(peaks.values())
+            summaries[len(items)] = report(len(items), samples, peaks, failures, first_content)
+
+        print(f"\nfake API calls: {fakes.state.calls}, TCP connections: {fakes.state.connections}")
+
+    if json_path:
+        with open(json_path, "w") as file:
+            json.dump(summaries, file, indent=2)
+    if metrics_log:
+        metrics_log.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Micro-benchmark for building, encoding and decoding the task payload passed between stages.
+
+Compares the former full REST-shaped dataclass + asdict + json.dumps round trip with
+utils.CompactTask over the stdlib json codec and orjson (when installed), and the
+per-call emoji regex compilation getTodoist used to do with the precompiled pattern.
+
+Usage: python src/lambda/benchmarks/bench_tasks.py [--sizes 1000 10000] [--repeat 5]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import utils  # noqa: E402
+from utils import CompactTask  # noqa: E402
+
+EMOJI_RANGES = "[\U0001f600-\U0001f64f\U0001f300-\U0001f5ff\U0001f680-\U0001f6ff\U0001f1e0-\U0001f1ff\U00010000-\U0010ffff]+"
+EMOJI_PATTERN = re.compile(EMOJI_RANGES, flags=re.UNICODE)
+
+
+@dataclass
+class LegacyTask:
+    """The REST task shape the pipeline serialised before CompactTask."""
+
+    assignee_id: str
+    assigner_id: str
+    comment_count: int
+    is_completed: bool
+    content: str
+    created_at: str
+    creator_id: str
+    description: str
+    due: dict
+    id: str
+    labels: list
+    order: int
+    parent_id: str
+    priority: int
+    project_id: str
+    section_id: str
+    url: str
+    duration: str
+    sync_id: str
+
+
+def make_items(n_tasks):
+    return [
+        {
+            "id": str(7_000_000_000 + i),
+            "content": f"Write the quarterly report part {i} \U0001f4dd",
+            "description": "Collect numbers from the dashboard and summarise them for the team.",
+            "project_id": "2300000000",
+            "section_id": "130000000",
+            "due": {"date": "2026-10-17", "string": "today", "is_recurring": False},
+            "responsible_uid": None,
+            "added_by_uid": "42",
+            "added_at": "2026-10-01T09:00:00Z",
+            "labels": ["work"],
+            "child_order": i,
+            "priority": 1,
+        }
+        for i in range(n_tasks)
+    ]
+
+
+def legacy_round_trip(items):
+    tasks = [LegacyTask(item["responsible_uid"], None, 0, False, item["content"], item["added_at"], item["added_by_uid"], item["description"], item["due"], item["id"], item["labels"], item["child_order"], None, item["priority"], item["project_id"], item["section_id"], f"https://todoist.com/app/task/{item['id']}", None, None) for item in items]
+    payload = json.dumps([asdict(task) for task in tasks])
+    return payload, [LegacyTask(**task) for task in json.loads(payload)]
+
+
+def compact_round_trip(items, dumps, loads):
+    tasks = [CompactTask(item["id"], item["content"], item["description"], item["project_id"], item["section_id"], item["due"]) for item in items]
+    payload = dumps([task.to_dict() for task in tasks])
+    return payload, [CompactTask.from_dict(task) for task in loads(payload)]
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak, result
+
+
+def run(n_tasks, repeat):
+    items = make_items(n_tasks)
+    variants = [
+        ("dataclass + asdict + json", lambda: legacy_round_trip(items)),
+        ("CompactTask + json", lambda: compact_round_trip(items, lambda value: json.dumps(value, separators=(",", ":")), json.loads)),
+    ]
+    if utils.orjson is not None:
+        variants.append(("CompactTask + orjson", lambda: compact_round_trip(items, utils.json_dumps, utils.json_loads)))
+
+    print(f"\n{n_tasks} tasks")
+    for label, function in variants:
+        best, peak, (payload, _) = measure(function, repeat)
+        print(f"  {label:<28} best {best * 1000:>9.2f} ms  {n_tasks / best:>11.0f} tasks/s  payload {len(payload) / 1024:>8.1f} KiB  peak {peak / 1024 / 1024:>7.2f} MiB")
+
+    contents = [item["content"] for item in items]
+    for label, function in [
+        ("re.compile per call", lambda: [re.compile(EMOJI_RANGES, flags=re.UNICODE).sub("", text) for text in contents]),
+        ("precompiled pattern", lambda: [EMOJI_PATTERN.sub("", text) for text in contents]),
+    ]:
+        best, _, _ = measure(function, repeat)
+        print(f"  strip emoji, {label:<15} best {best * 1000:>9.2f} ms  {n_tasks / best:>11.0f} tasks/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for n_tasks in args.sizes:
+        run(n_tasks, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
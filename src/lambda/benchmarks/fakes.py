@@ -0,0 +1,329 @@
+"""Local fake Todoist, OpenAI, Notion and Secrets Manager services for benchmarking.
+
+All four APIs are served by one threaded HTTP server on 127.0.0.1. Each service
+has a ServiceProfile controlling injected latency, 5xx error rate and 429 rate,
+so the real client libraries (requests, httpx, botocore) run unmodified:
+
+- Todoist Sync API:   POST /sync/v9/sync            (TODOIST_SYNC_URL)
+- OpenAI:             POST /v1/chat/completions     (OPENAI_BASE_URL), including stream=True
+- Notion:             /v1/pages, /v1/blocks/...     (NOTION_BASE_URL)
+- Secrets Manager:    POST / with X-Amz-Target      (AWS_ENDPOINT_URL_SECRETS_MANAGER)
+"""
+
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+SAMPLE_COMPLETION = """Title: {content}
+
+Description:
+Develop and integrate the change described by the task so the team can track it.
+
+Acceptance Criteria:
+1. **Pipeline Development**
+   - Create a new pipeline with *clear* ownership and `config` flags.
+   - Ensure the pipeline can intake, process, and output data seamlessly.
+
+2. **Testing and Validation**
+   - Perform end-to-end testing of the new pipeline.
+
+Estimation: 5 story points
+"""
+
+
+@dataclass
+class ServiceProfile:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 0.05
+    # Generation time per ~4 character token, streamed or not (OpenAI only)
+    token_ms: float = 0.0
+
+
+@dataclass
+class FakeState:
+    profiles: dict = field(default_factory=dict)
+    secrets: dict = field(default_factory=dict)
+    # Todoist items by id, plus the sync version each item last changed at
+    items: dict = field(default_factory=dict)
+    item_versions: dict = field(default_factory=dict)
+    version: int = 0
+    pages: dict = field(default_factory=dict)
+    # perf_counter() of the first request that put blocks on each page
+    first_content: dict = field(default_factory=dict)
+    calls: dict = field(default_factory=dict)
+    # TCP connections accepted, to see how well the clients reuse them
+    connections: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def make_task_items(n_tasks, project_ids, section_ids, seed=0):
+    """Synthetic Todoist Sync API items spread over the given projects and sections."""
+    rng = random.Random(seed)
+    items = []
+    for i in range(n_tasks):
+        item_id = str(8_000_000_000 + i)
+        items.append(
+            {
+                "id": item_id,
+                "content": f"Synthetic task {i}: {rng.choice(['add pipeline for weight', 'review kanban board', 'plan sprint', 'buy groceries'])}",
+                "description": rng.choice(["", "Some **context** for the task.", "- first point\n- second point"]),
+                "project_id": str(rng.choice(project_ids)),
+                "section_id": str(rng.choice(section_ids)),
+                "priority": rng.randint(1, 4),
+                "labels": [],
+                "due": None,
+                "child_order": i,
+                "checked": False,
+                "is_deleted": False,
+                "added_at": "2024-06-12T11:10:34.825542Z",
+                "added_by_uid": "49425011",
+            }
+        )
+    return items
+
+
+def rest_task_to_item(task):
+    """Convert a recorded REST task (e.g. a getTodoist output body) into a Sync API item."""
+    return {
+        "id": str(task["id"]),
+        "content": task["content"],
+        "description": task.get("description", ""),
+        "project_id": str(task["project_id"]),
+        "section_id": str(task["section_id"]) if task.get("section_id") is not None else None,
+        "priority": task.get("priority", 1),
+        "labels": task.get("labels") or [],
+        "due": task.get("due"),
+        "child_order": task.get("order"),
+        "checked": task.get("is_completed", False),
+        "is_deleted": False,
+        "added_at": task.get("created_at"),
+        "added_by_uid": task.get("creator_id"),
+    }
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeState = None
+
+    def setup(self):
+        super().setup()
+        # Headers and body are separate writes; without this, Nagle plus delayed
+        # ACKs stall responses on reused keep-alive connections by ~40 ms
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, payload, content_type="application/json", headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self, service):
+        """Apply the service profile; returns True when a fault response was sent."""
+        profile = self.state.profiles.get(service, ServiceProfile())
+        with self.state.lock:
+            self.state.calls[service] = self.state.calls.get(service, 0) + 1
+        delay = profile.latency_ms + random.uniform(-profile.jitter_ms, profile.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+        roll = random.random()
+        if roll < profile.rate_limit_rate:
+            self._send(429, {"object": "error", "status": 429, "code": "rate_limited", "message": "rate limited", "error": {"message": "rate limited"}}, headers={"Retry-After": str(profile.retry_after)})
+            return True
+        if roll < profile.rate_limit_rate + profile.error_rate:
+            self._send(500, {"object": "error", "status": 500, "code": "internal_server_error", "message": "injected error", "error": {"message": "injected error"}})
+            return True
+        return False
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/v1/blocks/") and path.endswith("/children"):
+            if not self._inject("notion"):
+                self._send(200, {"object": "list", "results": [], "has_more": False, "next_cursor": None})
+            return
+        self._send(404, {"error": f"unknown path {path}"})
+
+    def do_DELETE(self):
+        if not self._inject("notion"):
+            self._send(200, {"object": "block", "id": self.path.rsplit("/", 1)[-1], "archived": True})
+
+    def do_PATCH(self):
+        self._body()
+        if self._inject("notion"):
+            return
+        path = urlparse(self.path).path
+        if path.endswith("/children"):
+            with self.state.lock:
+                self.state.first_content.setdefault(path.split("/")[-2], time.perf_counter())
+            self._send(200, {"object": "list", "results": [], "has_more": False, "next_cursor": None})
+        else:
+            self._send(200, {"object": "page", "id": path.rsplit("/", 1)[-1]})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        if self.headers.get("X-Amz-Target", "").startswith("secretsmanager."):
+            self._secrets_manager(json.loads(body))
+        elif path.endswith("/chat/completions"):
+            self._openai(json.loads(body))
+        elif path.endswith("/sync/v9/sync"):
+            self._todoist_sync(parse_qs(body.decode()))
+        elif path == "/v1/pages":
+            if not self._inject("notion"):
+                page_id = str(uuid.uuid4())
+                page = json.loads(body)
+                with self.state.lock:
+                    self.state.pages[page_id] = page
+                    if page.get("children"):
+                        self.state.first_content[page_id] = time.perf_counter()
+                self._send(200, {"object": "page", "id": page_id})
+        else:
+            self._send(404, {"error": f"unknown path {path}"})
+
+    def _secrets_manager(self, request):
+        if self._inject("secretsmanager"):
+            return
+        name = request["SecretId"]
+        self._send(200, {"ARN": f"arn:aws:secretsmanager:us-east-2:000000000000:secret:{name}", "Name": name, "SecretString": json.dumps(self.state.secrets.get(name, {}))}, content_type="application/x-amz-json-1.1")
+
+    def _openai(self, request):
+        if self._inject("openai"):
+            return
+        content = request["messages"][-1]["content"]
+        completion = SAMPLE_COMPLETION.format(content=content)
+        tokens = [completion[start : start + 4] for start in range(0, len(completion), 4)]
+        token_delay = self.state.profiles.get("openai", ServiceProfile()).token_ms / 1000
+        if request.get("stream"):
+            self._stream_completion(request, tokens, token_delay)
+            return
+        if token_delay:
+            time.sleep(token_delay * len(tokens))
+        self._send(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": completion}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            },
+        )
+
+    def _stream_completion(self, request, tokens, token_delay):
+        """Server-sent events in chunked transfer encoding, one token per event."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        def event(data):
+            payload = f"data: {data}\n\n".encode()
+            self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+            self.wfile.flush()
+
+        for i, token in enumerate(tokens + [None]):
+            if token is not None and token_delay:
+                time.sleep(token_delay)
+            delta = {"content": token} if token is not None else {}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": request["model"], "choices": [{"index": 0, "delta": delta, "finish_reason": None if token is not None else "stop"}]}
+            event(json.dumps(chunk))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _todoist_sync(self, form):
+        if self._inject("todoist"):
+            return
+        state = self.state
+        if "commands" in form:
+            sync_status = {}
+            with state.lock:
+                for command in json.loads(form["commands"][0]):
+                    item = state.items.get(command["args"]["id"])
+                    if command["type"] == "item_close" and item is not None:
+                        state.version += 1
+                        item["checked"] = True
+                        state.item_versions[item["id"]] = state.version
+                        sync_status[command["uuid"]] = "ok"
+                    else:
+                        sync_status[command["uuid"]] = {"error_code": 22, "error": "Item not found"}
+            self._send(200, {"sync_status": sync_status, "sync_token": str(state.version)})
+            return
+
+        sync_token = form.get("sync_token", ["*"])[0]
+        with state.lock:
+            if sync_token == "*":
+                items = [item for item in state.items.values() if not item["checked"]]
+            else:
+                since = int(sync_token)
+                items = [state.items[item_id] for item_id, version in state.item_versions.items() if version > since]
+            payload = {"sync_token": str(state.version), "full_sync": sync_token == "*", "items": items}
+        self._send(200, payload)
+
+
+class FakeServices:
+    """Run the fake APIs in a background thread: ``with FakeServices(...) as fakes:``."""
+
+    def __init__(self, profiles=None, secrets=None, items=()):
+        self.state = FakeState(profiles=profiles or {}, secrets=secrets or {})
+        self.load_items(items)
+        handler = type("BoundFakeHandler", (FakeHandler,), {"state": self.state})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def load_items(self, items):
+        with self.state.lock:
+            for item in items:
+                self.state.version += 1
+                self.state.items[item["id"]] = dict(item)
+                self.state.item_versions[item["id"]] = self.state.version
+
+    def environ(self):
+        """Environment variables that point the handlers at this server."""
+        return {
+            "TODOIST_SYNC_URL": f"{self.url}/sync/v9/sync",
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "NOTION_BASE_URL": self.url,
+            "AWS_ENDPOINT_URL_SECRETS_MANAGER": self.url,
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+            "AWS_DEFAULT_REGION": "us-east-2",
+        }
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
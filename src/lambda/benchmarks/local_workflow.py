@@ -0,0 +1,138 @@
+"""Run the Todoist workflow locally the way the Step Functions definition in main/step_func.tf does.
+
+getTodoist runs once. With PIPELINE_CHUNK_SIZE > 0 its chunks fan out over a thread
+pool of --max-concurrency workers (the Map state), each chunk running putChatGPT ->
+putNotion -> putTodoist with the same per-stage retry policy and a failed chunk
+recorded instead of failing the run. With --chunk-size 0 the whole batch goes through
+each stage in turn. Every handler talks to the fakes in fakes.py, with injected
+latency and error rates, so per-chunk retries can be observed.
+
+Usage:
+    python src/lambda/benchmarks/local_workflow.py --tasks 100 --chunk-size 5 --max-concurrency 4
+    python src/lambda/benchmarks/local_workflow.py --tasks 100 --chunk-size 1 --openai-error-rate 0.05
+    python src/lambda/benchmarks/local_workflow.py --tasks 100 --chunk-size 0 --log workflow.log
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, LAMBDA_DIR)
+
+from bench_pipeline import SECRETS, prepare_workdir  # noqa: E402
+from fakes import FakeServices, ServiceProfile, make_task_items  # noqa: E402
+
+CHUNK_STAGES = ["putChatGPT", "putNotion", "putTodoist"]
+# Retry block of the stage states in step_func.tf
+MAX_ATTEMPTS = 2
+INTERVAL_SECONDS = 3
+BACKOFF_RATE = 1.5
+
+
+def call_with_retry(handler, event, stats, interval_seconds=INTERVAL_SECONDS):
+    """Invoke a handler like a Task state with Retry on States.TaskFailed."""
+    for attempt in range(MAX_ATTEMPTS + 1):
+        try:
+            return handler(event, None)
+        except Exception:  # noqa: BLE001
+            if attempt == MAX_ATTEMPTS:
+                raise
+            stats["retries"] += 1
+            time.sleep(interval_seconds * BACKOFF_RATE**attempt)
+
+
+def run_chunk(handlers, chunk, stats, interval_seconds):
+    """One Map iteration: the remaining stages for a single chunk, caught like ChunkFailed."""
+    event = chunk
+    try:
+        for stage in CHUNK_STAGES:
+            event = call_with_retry(handlers[stage], event, stats, interval_seconds)
+        return event
+    except Exception as error:  # noqa: BLE001
+        return {"chunk": chunk["chunk"], "error": {"Error": type(error).__name__, "Cause": str(error)}}
+
+
+def run_workflow(handlers, max_concurrency=4, interval_seconds=INTERVAL_SECONDS):
+    """Execute the state machine once, returning ``(output, stats)``."""
+    stats = {"retries": 0}
+    fetched = call_with_retry(handlers["getTodoist"], {"source": "local"}, stats, interval_seconds)
+    stats["tasks"] = fetched.get("summary", {}).get("count")
+    if stats["tasks"] == 0:
+        return fetched, stats
+
+    if "chunks" not in fetched:
+        event = fetched
+        for stage in CHUNK_STAGES:
+            event = call_with_retry(handlers[stage], event, stats, interval_seconds)
+        return event, stats
+
+    chunks = fetched["chunks"]
+    stats["chunks"] = len(chunks)
+    # executor.map preserves chunk order, like the Map state's output array
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks)))) as executor:
+        results = list(executor.map(lambda chunk: run_chunk(handlers, chunk, stats, interval_seconds), chunks))
+    stats["failed_chunks"] = [result["chunk"] for result in results if "error" in result]
+    return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=5, help="0 runs the whole batch through each stage")
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--retry-interval", type=float, default=0.1, help="seconds before the first retry (3 in step_func.tf)")
+    parser.add_argument("--log", help="write the handlers' output to this file")
+    for service, latency in (("todoist", 50), ("openai", 300), ("notion", 100), ("secretsmanager", 20)):
+        parser.add_argument(f"--{service}-latency-ms", type=float, default=latency)
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    profiles = {service: ServiceProfile(latency_ms=getattr(args, f"{service}_latency_ms"), jitter_ms=getattr(args, f"{service}_latency_ms") * 0.2, error_rate=getattr(args, f"{service}_error_rate")) for service in ("todoist", "openai", "notion", "secretsmanager")}
+
+    log_path = os.path.abspath(args.log) if args.log else os.devnull
+    workdir = prepare_workdir()
+    os.chdir(workdir)
+    with open("config.json") as file:
+        config = json.load(file)
+    items = make_task_items(args.tasks, [project["project_id"] for project in config["projects"]], [section["section_id"] for section in config["sections"]], seed=args.tasks)
+
+    with FakeServices(profiles=profiles, secrets=SECRETS, items=items) as fakes:
+        os.environ.update(fakes.environ())
+        os.environ.pop("PIPELINE_STATE_TABLE", None)
+        os.environ.pop("PIPELINE_PAYLOAD_BUCKET", None)
+        os.environ["PIPELINE_STATE_DIR"] = tempfile.mkdtemp(prefix="state_", dir=workdir)
+        os.environ["PIPELINE_CHUNK_SIZE"] = str(args.chunk_size)
+        os.environ["TODOIST_SYNC_MODE"] = "incremental"
+        os.environ.setdefault("OPENAI_RPM_LIMIT", "1000000")
+        os.environ.setdefault("OPENAI_TPM_LIMIT", "1000000000")
+        os.environ.setdefault("NOTION_REQUESTS_PER_SECOND", "1000")
+
+        import getTodoist
+        import putChatGPT
+        import putNotion
+        import putTodoist
+
+        handlers = {"getTodoist": getTodoist.lambda_handler, "putChatGPT": putChatGPT.lambda_handler, "putNotion": putNotion.lambda_handler, "putTodoist": putTodoist.lambda_handler}
+
+        start = time.perf_counter()
+        with open(log_path, "w") as log, contextlib.redirect_stdout(log):
+            _, stats = run_workflow(handlers, args.max_concurrency, args.retry_interval)
+        elapsed = time.perf_counter() - start
+        still_open = sum(1 for item in fakes.state.items.values() if not item.get("checked"))
+
+        print(f"{args.tasks} tasks, chunk size {args.chunk_size}, max concurrency {args.max_concurrency}: {elapsed * 1000:.1f} ms")
+        print(f"chunks: {stats.get('chunks', '-')}, failed chunks: {stats.get('failed_chunks', [])}, retries: {stats['retries']}, tasks left open: {still_open}")
+        print(f"fake API calls: {fakes.state.calls}")
+
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
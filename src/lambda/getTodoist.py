@@ -1,34 +1,39 @@
 import json
+import os
 import re
-from dataclasses import asdict
 from typing import List
 
-from todoist_api_python.api import TodoistAPI
-from utils import Task, get_secret
+from instrumentation import metrics
+from state_store import get_state_store
+from todoist_api_python.endpoints import get_sync_url
+from todoist_api_python.headers import create_headers
+from utils import HTTP_TIMEOUT, CompactTask, config_registry, dump_chunks, dump_tasks, get_secret, get_todoist_client, get_todoist_session, refresh_secret_on_auth_error
+
+SYNC_STATE_KEY = "state"
+# Overridable so the pipeline can run against a local fake Todoist
+SYNC_URL = os.environ.get("TODOIST_SYNC_URL", get_sync_url("sync"))
+# Tasks per Map-state chunk; 0 hands the whole batch to the next stage (see step_func.tf)
+CHUNK_SIZE = int(os.environ.get("PIPELINE_CHUNK_SIZE", "0"))
+
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001f600-\U0001f64f"  # emoticons
+    "\U0001f300-\U0001f5ff"  # symbols & pictographs
+    "\U0001f680-\U0001f6ff"  # transport & map symbols
+    "\U0001f1e0-\U0001f1ff"  # flags (iOS)
+    "\U00010000-\U0010ffff"  # emoticons
+    "]+",
+    flags=re.UNICODE,
+)
 
 
 def strip_rich_text(text: str) -> str:
-    emoji_pattern = re.compile(
-        "["
-        "\U0001f600-\U0001f64f"  # emoticons
-        "\U0001f300-\U0001f5ff"  # symbols & pictographs
-        "\U0001f680-\U0001f6ff"  # transport & map symbols
-        "\U0001f1e0-\U0001f1ff"  # flags (iOS)
-        "\U00010000-\U0010ffff"  # emoticons
-        "]+",
-        flags=re.UNICODE,
-    )
-    clean_text = emoji_pattern.sub(r"", text)
-    return clean_text
-
-
-def task_to_dict(task: Task) -> dict:
-    task.content = strip_rich_text(task.content)
-    return asdict(task)
-
-
-def tasks_to_json(tasks: List[Task], project_id_list: List) -> str:
-    tasks_dict = []
+    return EMOJI_PATTERN.sub("", text)
+
+
+def select_tasks(tasks: List[CompactTask], project_id_list: List) -> List[CompactTask]:
+    project_ids = set(project_id_list)
+    selected = []
     for task in tasks:
         print(
             f"""
@@ -36,33 +41,115 @@ def tasks_to_json(tasks: List[Task], project_id_list: List) -> str:
               task.section_id: {task.section_id},
               task.content: {task.content}"""
         )
-        if int(task.project_id) in project_id_list:
-            task_dict = task_to_dict(task)
-            tasks_dict.append(task_dict)
-    return json.dumps(tasks_dict)
+        if int(task.project_id) in project_ids:
+            task.content = strip_rich_text(task.content)
+            selected.append(task)
+    return selected
+
+
+def item_to_task(item: dict) -> CompactTask:
+    """Map a Sync API item onto the compact task passed down the pipeline."""
+    return CompactTask(item["id"], item["content"], item.get("description", ""), item["project_id"], item.get("section_id"), item.get("due"))
+
+
+def rest_to_task(task) -> CompactTask:
+    """Map a REST SDK ``Task`` onto the compact task passed down the pipeline."""
+    return CompactTask(task.id, task.content, task.description, task.project_id, task.section_id, task.due.to_dict() if task.due else None)
+
+
+def get_tasks_by_project(api, project_id_list: List) -> List[CompactTask]:
+    """Full fetch with a REST ``TodoistAPI``, filtered server-side to the configured projects."""
+    tasks = []
+    for project_id in project_id_list:
+        with metrics.phase("call.todoist"):
+            tasks.extend(rest_to_task(task) for task in api.get_tasks(project_id=project_id))
+    return tasks
+
+
+def get_tasks_incremental(todoist_api_key: str, project_id_list: List, store=None, task_store=None, session=None) -> List[CompactTask]:
+    """Fetch only the items changed since the last run via the Sync API.
+
+    The open tasks of the configured projects are mirrored in the state store,
+    one entry per task id in the ``todoist_sync_tasks`` namespace, and each delta
+    is applied to that mirror. The ``state`` entry only holds the sync token and
+    the mirrored task ids, so no single item grows towards DynamoDB's 400 KB
+    limit with the number of open tasks. The returned list is therefore the same
+    set of open tasks a full fetch would produce, while only the changed items
+    cross the network. A missing or reset state falls back to a full sync
+    (``sync_token="*"``).
+    """
+    store = store or get_state_store("todoist_sync")
+    task_store = task_store or get_state_store("todoist_sync_tasks")
+    session = session or get_todoist_session()
+    state = store.get(SYNC_STATE_KEY) or {"sync_token": "*", "task_ids": []}
+    with metrics.phase("call.todoist"):
+        response = session.post(
+            SYNC_URL,
+            headers=create_headers(token=todoist_api_key),
+            data={"sync_token": state["sync_token"], "resource_types": json.dumps(["items"])},
+            timeout=HTTP_TIMEOUT,
+        )
+        response.raise_for_status()
+        payload = response.json()
+
+    if payload.get("full_sync"):
+        mirror = {}
+    else:
+        stored = task_store.get_many(state["task_ids"])
+        mirror = {task_id: stored[task_id] for task_id in state["task_ids"] if task_id in stored}
+    previous_ids = set(state["task_ids"])
+    changed = {}
+    project_ids = {str(project_id) for project_id in project_id_list}
+    for item in payload.get("items", []):
+        if item.get("checked") or item.get("is_deleted") or str(item["project_id"]) not in project_ids:
+            mirror.pop(item["id"], None)
+        else:
+            mirror[item["id"]] = changed[item["id"]] = item_to_task(item).to_dict()
+    print(f"sync: full_sync={payload.get('full_sync')}, changed={len(payload.get('items', []))}, open={len(mirror)}")
+
+    # Task entries are written before the token, so a failure in between only
+    # makes the next run apply the same delta again
+    task_store.put_many(changed)
+    task_store.delete_many(previous_ids - set(mirror))
+    store.put(SYNC_STATE_KEY, {"sync_token": payload["sync_token"], "task_ids": list(mirror)})
+    return [CompactTask.from_dict(task_dict) for task_dict in mirror.values()]
 
 
+@metrics.handler("getTodoist")
 def lambda_handler(event, context):
-    secret = get_secret("todoist_key", "us-east-2")
+    with metrics.phase("secret"):
+        secret = get_secret("todoist_key", "us-east-2")
     secret_dict = json.loads(secret)
     todoist_api_key = secret_dict["TODOIST_API_KEY"]
-    api = TodoistAPI(todoist_api_key)
-    # read in config.json
-    with open("config.json") as file:
-        config = json.load(file)
-    n_project_ids = len(config["projects"])
-    project_id_list = [config["projects"][i]["project_id"] for i in range(n_project_ids)]
+    sync_mode = os.environ.get("TODOIST_SYNC_MODE", "full")
+    project_id_list = config_registry.project_id_list
     print(f"project_id_list: {project_id_list}")
 
     try:
-        tasks = api.get_tasks()
+        if sync_mode == "incremental":
+            tasks = get_tasks_incremental(todoist_api_key, project_id_list)
+        else:
+            # The REST SDK is only needed for full fetches
+            api = get_todoist_client(todoist_api_key)
+            tasks = get_tasks_by_project(api, project_id_list)
         print(f"tasks: {tasks}")
-        json_str = tasks_to_json(tasks, project_id_list)
-        print(f"json_str: {json_str}")
+        with metrics.phase("serialize"):
+            selected = select_tasks(tasks, project_id_list)
+            if CHUNK_SIZE > 0:
+                chunks, summary = dump_chunks(selected, "getTodoist", CHUNK_SIZE)
+                response = {"statusCode": 200, "chunks": chunks, "summary": summary}
+            else:
+                json_str, summary = dump_tasks(selected, "getTodoist")
+                response = {"statusCode": 200, "body": json_str, "summary": summary}
+        metrics.count("tasks", len(tasks))
+        print(f"response: {response}")
     except Exception as error:
         print(error)
+        refresh_secret_on_auth_error(error, "todoist_key", "us-east-2")
+        # Fail the task so the state machine's Retry sees the real error
+        raise
 
-    return {"statusCode": 200, "body": json_str}
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,122 @@
+"""Per-invocation phase timings emitted as CloudWatch Embedded Metric Format (EMF) log lines.
+
+Handlers wrap their entry point with ``@metrics.handler("name")`` and time the
+interesting parts with ``with metrics.phase("call.openai"):``. Timings of the same
+phase are summed (with a count and max) over the invocation, so per-task calls made
+from worker threads add up. At the end of every invocation one JSON line is printed;
+CloudWatch turns it into metrics and benchmarks/aggregate_metrics.py summarises it
+from exported logs.
+
+Phase names used by the handlers:
+- ``init``: from this module's import to the first invocation (cold starts only)
+- ``import.<package>``: deferred SDK imports, see ``lazy_import``
+- ``secret``: get_secret, including cache hits
+- ``client_init``: SDK client construction
+- ``call.<service>``: one external API call
+- ``deserialize`` / ``serialize``: event body parsing and response encoding
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "WyattProd/Lambda")
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+_module_loaded_at = time.perf_counter()
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def record(self, name, elapsed_ms):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0.0, 0, 0.0])
+            timing[0] += elapsed_ms
+            timing[1] += 1
+            timing[2] = max(timing[2], elapsed_ms)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + value
+
+    def flush(self, function_name, cold_start=False):
+        """Print the EMF line for the finished invocation and reset the counters."""
+        with self._lock:
+            timings, self._timings = self._timings, {}
+            counts, self._counts = self._counts, {}
+        if not ENABLED:
+            return None
+
+        record = {"FunctionName": function_name, "ColdStart": cold_start}
+        definitions = []
+        for name, (total, calls, longest) in sorted(timings.items()):
+            record[f"{name}_ms"] = round(total, 3)
+            definitions.append({"Name": f"{name}_ms", "Unit": "Milliseconds"})
+            if calls > 1:
+                record[f"{name}_count"] = calls
+                record[f"{name}_max_ms"] = round(longest, 3)
+        for name, value in sorted(counts.items()):
+            record[name] = value
+            definitions.append({"Name": name, "Unit": "Count"})
+        # EMF allows at most 100 metrics per directive; the rest stay as plain log fields
+        record["_aws"] = {"Timestamp": int(time.time() * 1000), "CloudWatchMetrics": [{"Namespace": NAMESPACE, "Dimensions": [["FunctionName"]], "Metrics": definitions[:100]}]}
+        print(json.dumps(record))
+        return record
+
+    def handler(self, name=None):
+        """Decorator for a lambda_handler: times the whole invocation and flushes afterwards."""
+
+        def decorate(function):
+            function_name = os.environ.get("AWS_LAMBDA_FUNCTION_NAME") or name or function.__module__
+            invocations = [0]
+
+            @wraps(function)
+            def wrapper(event, context):
+                cold_start = invocations[0] == 0
+                invocations[0] += 1
+                if cold_start:
+                    self.record("init", (time.perf_counter() - _module_loaded_at) * 1000)
+                try:
+                    with self.phase("handler"):
+                        return function(event, context)
+                finally:
+                    self.flush(function_name, cold_start)
+
+            return wrapper
+
+        return decorate
+
+
+metrics = Metrics()
+
+
+def lazy_import(module_name):
+    """Import ``module_name`` on first use, timing it as ``import.<package>``.
+
+    For SDKs a handler only needs on some paths, so cold starts that do not
+    reach those paths skip the import entirely.
+    """
+    module = sys.modules.get(module_name)
+    # A module another thread is still importing is in sys.modules already;
+    # import_module waits for that import to finish
+    if module is None or getattr(getattr(module, "__spec__", None), "_initializing", False):
+        with metrics.phase(f"import.{module_name.split('.')[0]}"):
+            module = importlib.import_module(module_name)
+    return module
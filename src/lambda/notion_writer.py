@@ -0,0 +1,263 @@
+"""Notion page writing shared by putNotion and the streaming path of putChatGPT.
+
+Pages are created or updated through the rate-limited notion_call, and each
+Todoist task id is mapped to its page id in the ``notion_index`` state store,
+so reruns update or skip a page instead of duplicating it.
+"""
+
+import hashlib
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from instrumentation import lazy_import, metrics
+from utils import CompactTask, TokenBucket, backoff_delay, get_notion_client, get_secret, iter_notion_blocks, iter_stream_lines, markdown_to_notion_blocks
+
+KANBAN_DATABASE_ID = "c8a2c83ac85b4fe08b36bf631604f017"
+WEIGHT_DATABASE_ID = "17f1c81bc0e04694a6d546173135b2ac"
+# Overridable so the pipeline can run against a local fake Notion
+NOTION_BASE_URL = os.environ.get("NOTION_BASE_URL", "https://api.notion.com")
+# Notion accepts at most 100 children per create/append request
+CHILDREN_LIMIT = 100
+MAX_RETRIES = int(os.environ.get("NOTION_MAX_RETRIES", "5"))
+# Notion's documented average limit is ~3 requests per second per integration; in
+# the deployed workflow this is the container's share of it (see main/lambda.tf)
+REQUESTS_PER_SECOND = float(os.environ.get("NOTION_REQUESTS_PER_SECOND", "3"))
+# Todoist task id -> Notion page id index entries expire after this many seconds
+INDEX_TTL = int(os.environ.get("NOTION_INDEX_TTL", str(90 * 24 * 3600)))
+# Streaming writes (stream_page) append once this many blocks are pending or
+# this many seconds have passed since the last request, whichever comes first
+STREAM_FLUSH_BLOCKS = int(os.environ.get("NOTION_STREAM_FLUSH_BLOCKS", "20"))
+STREAM_FLUSH_SECONDS = float(os.environ.get("NOTION_STREAM_FLUSH_SECONDS", "1.0"))
+# Properties that are regenerated on every run and must not count as a change
+VOLATILE_PROPERTIES = ("Deadline", "Date")
+
+# A share below one request per second still needs room for one whole request
+notion_bucket = TokenBucket(REQUESTS_PER_SECOND, max(1.0, REQUESTS_PER_SECOND))
+
+
+def notion_call(method, **kwargs):
+    """Call a Notion SDK method within the shared rate limit.
+
+    Rate-limited (429) and transient 5xx responses are retried, including gateway
+    errors without a Notion error body, as are request timeouts; a Retry-After
+    header pauses every worker, otherwise exponential backoff is used.
+    """
+    errors = lazy_import("notion_client.errors")
+    for attempt in range(MAX_RETRIES + 1):
+        notion_bucket.acquire()
+        try:
+            with metrics.phase("call.notion"):
+                return method(**kwargs)
+        except errors.HTTPResponseError as error:
+            # APIResponseError (errors with a Notion JSON body) is a subclass
+            status = error.status
+            if attempt == MAX_RETRIES or not (status == 429 or status >= 500):
+                raise
+            retry_after = error.headers.get("retry-after")
+            if retry_after:
+                notion_bucket.pause(float(retry_after))
+                print(f"notion rate limited, pausing {retry_after}s (attempt {attempt + 1})")
+            else:
+                time.sleep(backoff_delay(attempt))
+        except errors.RequestTimeoutError:
+            if attempt == MAX_RETRIES:
+                raise
+            print(f"notion request timed out (attempt {attempt + 1})")
+            time.sleep(backoff_delay(attempt))
+
+
+def make_client():
+    with metrics.phase("secret"):
+        secret = get_secret("notion_token", "us-east-2")
+    secret_dict = json.loads(secret)
+    return get_notion_client(secret_dict["NOTION_API_TOKEN"], NOTION_BASE_URL)
+
+
+def build_page(task: CompactTask):
+    """Return the ``pages.create`` arguments for a task, or None if it has no Notion page."""
+    if task.name == "Work":
+        description_blocks = markdown_to_notion_blocks(task.description)
+        chat_blocks = markdown_to_notion_blocks(task.agent_output)
+        # combine description_blocks and chat_blocks as a single list
+        children_blocks = description_blocks + chat_blocks
+        # TODO: figure out how to have this show up in Notion using makrdown formatting
+        return {
+            "parent": {"database_id": KANBAN_DATABASE_ID},
+            "properties": {
+                "title": {"title": [{"type": "text", "text": {"content": task.content}}]},
+                "Team": {"select": {"name": task.name}},
+                # TODO: maybe make deadline multi day events for longer kanban stories?
+                "Deadline": {
+                    "date": {
+                        "start": str(datetime.now()),
+                        "end": str(datetime.now() + timedelta(minutes=30)),
+                    }
+                },
+            },
+            "children": children_blocks,
+        }
+    elif task.name == "Home":
+        children_blocks = markdown_to_notion_blocks(task.description)
+        return {
+            "parent": {"database_id": KANBAN_DATABASE_ID},
+            "properties": {
+                "title": {"title": [{"type": "text", "text": {"content": task.content}}]},
+                "Team": {"select": {"name": task.name}},
+                # Add a deadline date to the Deadline property where Start Date is current datetime and end date is 5pm EST today
+                "Deadline": {
+                    "date": {
+                        "start": str(datetime.now()),
+                        "end": str(datetime.now() + timedelta(minutes=30)),
+                    }
+                },
+            },
+            "children": children_blocks,
+        }
+    elif task.project_id == "Weight":
+        # Add to the Weight database where the Weight property gets the number in task.content
+        return {
+            "parent": {"database_id": WEIGHT_DATABASE_ID},
+            "properties": {
+                "Weight": {"number": float(task.content)},
+                "Date": {"date": {"start": str(datetime.now().date())}},
+            },
+        }
+    return None
+
+
+def write_page(notion, page, on_create=None):
+    """Create a page, appending children beyond the first 100 in further requests.
+
+    ``on_create(page_id)`` is called as soon as the page exists, before the appends.
+    """
+    children = page.pop("children", [])
+    created = notion_call(notion.pages.create, children=children[:CHILDREN_LIMIT], **page)
+    if on_create is not None:
+        on_create(created["id"])
+    for start in range(CHILDREN_LIMIT, len(children), CHILDREN_LIMIT):
+        notion_call(notion.blocks.children.append, block_id=created["id"], children=children[start : start + CHILDREN_LIMIT])
+    return created
+
+
+def page_fingerprint(page):
+    """Hash of the page content, ignoring the timestamps set at write time."""
+    stable = dict(page, properties={name: value for name, value in page["properties"].items() if name not in VOLATILE_PROPERTIES})
+    return hashlib.sha256(json.dumps(stable, sort_keys=True).encode()).hexdigest()
+
+
+def update_page(notion, page_id, page):
+    """Update an existing page in place: stable properties plus a full children replace."""
+    properties = {name: value for name, value in page["properties"].items() if name not in VOLATILE_PROPERTIES}
+    notion_call(notion.pages.update, page_id=page_id, properties=properties)
+    if "children" not in page:
+        return
+    existing = []
+    cursor = None
+    while True:
+        kwargs = {"block_id": page_id, "page_size": 100}
+        if cursor:
+            kwargs["start_cursor"] = cursor
+        response = notion_call(notion.blocks.children.list, **kwargs)
+        existing.extend(block["id"] for block in response["results"])
+        if not response.get("has_more"):
+            break
+        cursor = response["next_cursor"]
+    for block_id in existing:
+        notion_call(notion.blocks.delete, block_id=block_id)
+    children = page["children"]
+    for start in range(0, len(children), CHILDREN_LIMIT):
+        notion_call(notion.blocks.children.append, block_id=page_id, children=children[start : start + CHILDREN_LIMIT])
+
+
+def is_page_gone(error):
+    """True when Notion rejects a write because the page was deleted or archived."""
+    return error.code == "object_not_found" or (error.code == "validation_error" and "archived" in str(error))
+
+
+def upsert_page(notion, task, page, indexed, index, index_lock):
+    """Create, update or skip the page for ``task`` based on its index entry.
+
+    Returns ``"created"``, ``"updated"`` or ``"unchanged"``.
+    """
+    fingerprint = page_fingerprint(page)
+    entry = indexed.get(task.id)
+    if entry and entry["fingerprint"] == fingerprint:
+        return "unchanged"
+    if entry:
+        try:
+            update_page(notion, entry["page_id"], page)
+            page_id = entry["page_id"]
+            action = "updated"
+        except lazy_import("notion_client").APIResponseError as error:
+            if not is_page_gone(error):
+                raise
+            # The indexed page was deleted or archived in Notion; write a new one
+            print(f"notion page {entry['page_id']} of task {task.id} is gone, recreating it")
+            with index_lock:
+                index.delete(task.id)
+            entry = None
+    if not entry:
+
+        def record(page_id):
+            # Indexed before the appends, so a retry after one of them fails updates
+            # this page in place (the fingerprint never matches) instead of duplicating it
+            with index_lock:
+                index.put(task.id, {"page_id": page_id, "fingerprint": None}, ttl=INDEX_TTL)
+
+        page_id = write_page(notion, page, on_create=record)["id"]
+        action = "created"
+    with index_lock:
+        index.put(task.id, {"page_id": page_id, "fingerprint": fingerprint}, ttl=INDEX_TTL)
+    return action
+
+
+def stream_page(notion, task, text_chunks, index, index_lock):
+    """Write the page of a Work task while its agent_output is still being generated.
+
+    ``text_chunks`` yields pieces of the completion. Each completed markdown line
+    is converted to blocks right away; the page is created together with the
+    first block and the rest is appended in batches (STREAM_FLUSH_BLOCKS /
+    STREAM_FLUSH_SECONDS) through the shared rate limit. The index entry is
+    written as soon as the page exists and again with the final fingerprint,
+    so upsert_page leaves the finished page alone and updates a partial one.
+    Returns the full completion text.
+    """
+    received = []
+
+    def text():
+        for chunk in text_chunks:
+            received.append(chunk)
+            yield chunk
+
+    # agent_output is still empty, so the children are just the description blocks
+    page = build_page(task)
+    pending = page.pop("children")
+    page_id = None
+    started = last_flush = time.monotonic()
+
+    def flush():
+        nonlocal page_id, pending, last_flush
+        if page_id is None:
+            page_id = notion_call(notion.pages.create, children=pending[:CHILDREN_LIMIT], **page)["id"]
+            metrics.record("stream.first_content", (time.monotonic() - started) * 1000)
+            with index_lock:
+                index.put(task.id, {"page_id": page_id, "fingerprint": None}, ttl=INDEX_TTL)
+            pending = pending[CHILDREN_LIMIT:]
+        for start in range(0, len(pending), CHILDREN_LIMIT):
+            notion_call(notion.blocks.children.append, block_id=page_id, children=pending[start : start + CHILDREN_LIMIT])
+        pending = []
+        last_flush = time.monotonic()
+
+    for block in iter_notion_blocks(iter_stream_lines(text())):
+        pending.append(block)
+        if page_id is None or len(pending) >= STREAM_FLUSH_BLOCKS or time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+            flush()
+    if pending or page_id is None:
+        flush()
+
+    task.agent_output = "".join(received)
+    with index_lock:
+        index.put(task.id, {"page_id": page_id, "fingerprint": page_fingerprint(build_page(task))}, ttl=INDEX_TTL)
+    return task.agent_output
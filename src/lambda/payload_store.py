@@ -0,0 +1,84 @@
+import gzip
+import os
+import tempfile
+import uuid
+
+from aws_clients import get_client
+from instrumentation import metrics
+
+# Spool writes in memory up to this size before falling back to a /tmp file
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+class FilePayloadStore:
+    """Gzip newline-delimited JSON payloads stored as files.
+
+    Used as the local stand-in for the payload bucket. On Lambda the directory is
+    under /tmp, so references only resolve inside the same container; deployed
+    workflows use the S3 store.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.environ.get("PIPELINE_PAYLOAD_DIR") or os.path.join(os.environ.get("PIPELINE_STATE_DIR", "/tmp"), "payloads")
+
+    def write_lines(self, prefix, lines):
+        """Write ``lines`` (str, without newlines) and return ``(uri, compressed_bytes)``."""
+        path = os.path.join(self.directory, prefix, f"{uuid.uuid4()}.ndjson.gz")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as file:
+            for line in lines:
+                file.write(line)
+                file.write("\n")
+        return f"file://{path}", os.path.getsize(path)
+
+    def open(self, uri):
+        return open(uri[len("file://") :], "rb")
+
+
+class S3PayloadStore:
+    """Gzip newline-delimited JSON payloads stored under a prefix of an S3 bucket.
+
+    Objects are written once per stage and read by the next one; the bucket's
+    lifecycle rule on the prefix removes them afterwards.
+    """
+
+    def __init__(self, bucket, key_prefix="pipeline-payloads"):
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.client = get_client("s3")
+
+    def write_lines(self, prefix, lines):
+        key = f"{self.key_prefix}/{prefix}/{uuid.uuid4()}.ndjson.gz"
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as spool:
+            with gzip.GzipFile(fileobj=spool, mode="wb") as file:
+                for line in lines:
+                    file.write(line.encode())
+                    file.write(b"\n")
+            size = spool.tell()
+            spool.seek(0)
+            with metrics.phase("call.s3"):
+                self.client.upload_fileobj(spool, self.bucket, key, ExtraArgs={"ContentType": "application/x-ndjson", "ContentEncoding": "gzip"})
+        return f"s3://{self.bucket}/{key}", size
+
+    def open(self, uri):
+        bucket, _, key = uri[len("s3://") :].partition("/")
+        with metrics.phase("call.s3"):
+            return self.client.get_object(Bucket=bucket, Key=key)["Body"]
+
+
+def get_payload_store():
+    """Return the S3 store when PIPELINE_PAYLOAD_BUCKET is set, else the file store."""
+    bucket = os.environ.get("PIPELINE_PAYLOAD_BUCKET")
+    if bucket:
+        return S3PayloadStore(bucket)
+    return FilePayloadStore()
+
+
+def iter_payload_lines(uri):
+    """Stream the decoded lines of a stored payload without loading it whole."""
+    # Cheap per call: the S3 store only holds the container's shared client
+    store = S3PayloadStore(uri[len("s3://") :].partition("/")[0]) if uri.startswith("s3://") else FilePayloadStore()
+    with store.open(uri) as raw, gzip.GzipFile(fileobj=raw, mode="rb") as file:
+        for line in file:
+            if line.strip():
+                yield line
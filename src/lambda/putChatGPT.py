@@ -1,60 +1,129 @@
+import hashlib
 import json
-
-from openai import OpenAI
-from utils import SuperTask, get_secret, tasks_to_json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import notion_writer
+from instrumentation import lazy_import, metrics
+from state_store import get_state_store
+from utils import ChunkFailed, CompactTask, TokenBucket, backoff_delay, chunk_response, config_registry, dump_tasks, get_openai_client, get_secret, iter_tasks, refresh_secret_on_auth_error
+
+MODEL = "gpt-4o"
+# Upper bound on concurrent chat completions per invocation
+MAX_IN_FLIGHT = int(os.environ.get("OPENAI_MAX_IN_FLIGHT", "8"))
+# Account budget shared by all in-flight requests of this container; the deployed
+# workflow sets this container's share of it (see main/lambda.tf)
+REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_RPM_LIMIT", "500"))
+TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TPM_LIMIT", "30000"))
+MAX_RETRIES = int(os.environ.get("OPENAI_MAX_RETRIES", "5"))
+# Completion cache: entries expire after CACHE_TTL seconds, the local file store keeps at most CACHE_MAX_ITEMS
+CACHE_TTL = int(os.environ.get("OPENAI_CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MAX_ITEMS = int(os.environ.get("OPENAI_CACHE_MAX_ITEMS", "5000"))
+# Stream completions of Work tasks straight into their Notion pages instead of
+# waiting for the whole text and leaving the page to putNotion
+STREAMING = os.environ.get("OPENAI_STREAMING", "0") == "1"
+
+request_bucket = TokenBucket(REQUESTS_PER_MINUTE / 60, REQUESTS_PER_MINUTE)
+token_bucket = TokenBucket(TOKENS_PER_MINUTE / 60, TOKENS_PER_MINUTE)
+
+
+def completion_cache_key(system_prompt, content):
+    """Content address of a completion: model, prompt file contents and task content."""
+    return hashlib.sha256(json.dumps([MODEL, system_prompt, content]).encode()).hexdigest()
+
+
+def estimate_tokens(messages):
+    # Rough OpenAI heuristic of ~4 characters per token, good enough for budgeting
+    return sum(len(message["content"]) for message in messages) // 4 + 1
+
+
+def create_completion(client, messages, **kwargs):
+    """Call the chat completions API within the rate budget, backing off on 429s.
+
+    The client is built with ``max_retries=0``, so the transient failures the SDK
+    would otherwise retry (5xx, connection errors and timeouts) are retried here too.
+    With ``stream=True`` this returns once the response has started; the chunks
+    are read by the caller.
+    """
+    openai = lazy_import("openai")
+    for attempt in range(MAX_RETRIES + 1):
+        request_bucket.acquire()
+        token_bucket.acquire(estimate_tokens(messages))
+        try:
+            with metrics.phase("call.openai"):
+                return client.chat.completions.create(messages=messages, model=MODEL, **kwargs)
+        except openai.RateLimitError as error:
+            if attempt == MAX_RETRIES:
+                raise
+            retry_after = error.response.headers.get("retry-after")
+            delay = float(retry_after) if retry_after else backoff_delay(attempt)
+            print(f"rate limited, retrying in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+        except (openai.InternalServerError, openai.APIConnectionError) as error:
+            # APITimeoutError is a subclass of APIConnectionError
+            if attempt == MAX_RETRIES:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"{type(error).__name__}, retrying in {delay:.2f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+
+
+def stream_text(stream):
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def enrich_task(client, task, system_prompt, stream_writer=None):
+    """Enrich a single task, returning ``(task, error)`` so failures stay isolated.
+
+    ``stream_writer(task, text_chunks)`` consumes a streamed completion and
+    returns its full text (see notion_writer.stream_page).
+    """
+    try:
+        if system_prompt:
+            messages = [
+                {"role": "user", "content": system_prompt},
+                {"role": "user", "content": task.content},
+            ]
+            if stream_writer is not None:
+                stream = create_completion(client, messages, stream=True)
+                with metrics.phase("stream.openai"):
+                    task.agent_output = stream_writer(task, stream_text(stream))
+            else:
+                chat_completion = create_completion(client, messages)
+                task.agent_output = chat_completion.choices[0].message.content
+        return task, None
+    except Exception as error:  # noqa: BLE001
+        return task, error
 
 
+@metrics.handler("putChatGPT")
 def lambda_handler(event, context):
     """AWS Lambda entry point."""
     print(f"event: {event}")
 
-    secret = get_secret("open_ai_key", "us-east-2")
-    secret_dict = json.loads(secret)
-
-    with open("config.json") as file:
-        config = json.load(file)
-
-    project_id_list = [project["project_id"] for project in config["projects"]]
-
-    # Initialize OpenAI client with the custom http_client
-    client = OpenAI(api_key=secret_dict["OPEN_AI_KEY"])
-
-    tasks = []
-    for json_task in json.loads(event["body"]):
+    jobs = []
+    for json_task in iter_tasks(event["body"]):
         try:
-            system_prompt = ""
-            task = SuperTask(**json_task)
+            task = CompactTask.from_dict(json_task)
 
             print(f"\njson_task: {json_task}")
             print(f"\ntask: {task}")
 
-            if int(task.project_id) not in project_id_list:
+            project_cfg = config_registry.project(task.project_id)
+            if project_cfg is None:
                 continue
 
-            idx = project_id_list.index(int(task.project_id))
-            project_cfg = config["projects"][idx]
-
             task.passChatGPT = project_cfg["passChatGPT"]
             task.name = project_cfg["name"]
 
-            if task.section_id == "158311513":  # Biftu
-                with open("biftu.txt") as file:
-                    system_prompt = file.read()
-            elif task.section_id == "158311520":  # Tony
-                with open("tony.txt") as file:
-                    system_prompt = file.read()
-
-            if system_prompt:
-                chat_completion = client.chat.completions.create(
-                    messages=[
-                        {"role": "user", "content": system_prompt},
-                        {"role": "user", "content": task.content},
-                    ],
-                    model="gpt-4o",
-                )
-                task.agent_output = chat_completion.choices[0].message.content
+            system_prompt = config_registry.system_prompt(task.section_id)
 
-            tasks.append(task)
+            jobs.append((task, system_prompt))
 
         except Exception as error:  # noqa: BLE001
             print(error)
@@ -63,7 +132,84 @@ def lambda_handler(event, context):
                 "body": json.dumps({"error": str(error)}),
             }
 
-    return {
-        "statusCode": 200,
-        "body": tasks_to_json(tasks),
-    }
+    # Unchanged (prompt, content) pairs reuse their previous agent_output
+    cache = get_state_store("chatgpt_cache", max_items=CACHE_MAX_ITEMS)
+    cache_keys = {task.id: completion_cache_key(system_prompt, task.content) for task, system_prompt in jobs if system_prompt}
+    cached = cache.get_many(cache_keys.values())
+    pending = []
+    for task, system_prompt in jobs:
+        cache_key = cache_keys.get(task.id)
+        if cache_key in cached:
+            task.agent_output = cached[cache_key]
+        elif system_prompt:
+            pending.append((task, system_prompt))
+    print(f"completion cache: {len(cached)} hits, {len(cache_keys) - len(cached)} misses")
+    metrics.count("cache_hits", len(cached))
+    metrics.count("cache_misses", len(cache_keys) - len(cached))
+
+    enriched = {}
+    if pending:
+        # The secret and the OpenAI SDK are only needed when something misses the cache
+        with metrics.phase("secret"):
+            secret = get_secret("open_ai_key", "us-east-2")
+        secret_dict = json.loads(secret)
+
+        # Built once per container and kept across warm invocations.
+        # OPENAI_BASE_URL can point the client at a local fake server.
+        client = get_openai_client(secret_dict["OPEN_AI_KEY"])
+
+        stream_writers = {}
+        if STREAMING:
+            # Only Work pages show agent_output, and pages that already exist are
+            # left to putNotion's in-place update
+            index = get_state_store("notion_index")
+            candidates = [task.id for task, _ in pending if task.name == "Work"]
+            indexed = index.get_many(candidates)
+            streamed = [task_id for task_id in candidates if task_id not in indexed]
+            if streamed:
+                notion = notion_writer.make_client()
+                index_lock = threading.Lock()
+                stream_writers = dict.fromkeys(streamed, partial(notion_writer.stream_page, notion, index=index, index_lock=index_lock))
+            metrics.count("tasks_streamed", len(streamed))
+
+        # executor.map preserves input order
+        with ThreadPoolExecutor(max_workers=min(MAX_IN_FLIGHT, len(pending))) as executor:
+            enriched = dict((task.id, (task, error)) for task, error in executor.map(lambda job: enrich_task(client, *job, stream_writer=stream_writers.get(job[0].id)), pending))
+    results = [enriched.get(task.id, (task, None)) for task, _ in jobs]
+
+    cache.put_many({cache_keys[task.id]: task.agent_output for task, error in enriched.values() if error is None and task.id in cache_keys}, ttl=CACHE_TTL)
+
+    # Failed tasks are left out of the batch so they stay open in Todoist and
+    # are picked up again on the next run instead of failing the whole batch.
+    tasks = []
+    errors = []
+    for task, error in results:
+        if error is None:
+            tasks.append(task)
+        else:
+            print(f"error enriching task {task.id}: {error}")
+            refresh_secret_on_auth_error(error, "open_ai_key", "us-east-2")
+            errors.append(str(error))
+
+    # A Map-state chunk fails as a whole so Step Functions retries it; the tasks
+    # that did succeed are answered from the completion cache on the retry
+    if errors and "chunk" in event:
+        raise ChunkFailed(f"{len(errors)} of {len(results)} tasks failed: {errors[0]}")
+    if errors and not tasks:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": errors[0]}),
+        }
+
+    with metrics.phase("serialize"):
+        body, summary = dump_tasks(tasks, "putChatGPT")
+    metrics.count("tasks", len(tasks))
+
+    return chunk_response(
+        event,
+        {
+            "statusCode": 200,
+            "body": body,
+            "summary": summary,
+        },
+    )
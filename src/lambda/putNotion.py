@@ -1,74 +1,73 @@
 import json
-from datetime import datetime, timedelta
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-from notion_client import Client
-from utils import SuperTask, get_secret, markdown_to_notion_blocks, tasks_to_json
+from instrumentation import metrics
+from notion_writer import build_page, make_client, upsert_page
+from state_store import get_state_store
+from utils import ChunkFailed, CompactTask, chunk_response, dump_tasks, iter_tasks, refresh_secret_on_auth_error
 
+MAX_IN_FLIGHT = int(os.environ.get("NOTION_MAX_IN_FLIGHT", "3"))
 
+
+def process_task(notion, json_task, indexed, index, index_lock):
+    """Write one task to Notion, returning ``(task, action, error)`` so failures stay isolated."""
+    try:
+        task = CompactTask.from_dict(json_task)
+        page = build_page(task)
+        action = "skipped"
+        if page is not None:
+            action = upsert_page(notion, task, page, indexed, index, index_lock)
+        return task, action, None
+    except Exception as error:  # noqa: BLE001
+        return json_task, None, error
+
+
+@metrics.handler("putNotion")
 def lambda_handler(event, context):
     print(f"event: {event}")
-    secret = get_secret("notion_token", "us-east-2")
-    secret_dict = json.loads(secret)
-    notion_token = secret_dict["NOTION_API_TOKEN"]
-    notion = Client(auth=notion_token)
+    notion = make_client()
+    with metrics.phase("deserialize"):
+        json_tasks = list(iter_tasks(event["body"]))
+
+    # Todoist task id -> Notion page id, so reruns update or skip instead of duplicating pages
+    index = get_state_store("notion_index")
+    index_lock = threading.Lock()
+    indexed = index.get_many(str(json_task.get("id")) for json_task in json_tasks)
+
+    # executor.map preserves input order
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_IN_FLIGHT, len(json_tasks)))) as executor:
+        results = list(executor.map(lambda json_task: process_task(notion, json_task, indexed, index, index_lock), json_tasks))
+
+    # Failed tasks are left out of the batch so they are not closed in Todoist
+    # and get written again on the next run.
     list_task_dict = []
-    for json_task in json.loads(event["body"]):
-        print(f"\njson_task: {json_task}")
-        task = SuperTask(**json_task)
-        # Create a new task in the Notion Kanban board
-        try:
-            if task.name == "Work":
-                description_blocks = markdown_to_notion_blocks(task.description)
-                chat_blocks = markdown_to_notion_blocks(task.agent_output)
-                # combine description_blocks and chat_blocks as a single list
-                children_blocks = description_blocks + chat_blocks
-                # TODO: figure out how to have this show up in Notion using makrdown formatting
-                notion.pages.create(
-                    parent={"database_id": "c8a2c83ac85b4fe08b36bf631604f017"},
-                    properties={
-                        "title": {"title": [{"type": "text", "text": {"content": task.content}}]},
-                        "Team": {"select": {"name": task.name}},
-                        # TODO: maybe make deadline multi day events for longer kanban stories?
-                        "Deadline": {
-                            "date": {
-                                "start": str(datetime.now()),
-                                "end": str(datetime.now() + timedelta(minutes=30)),
-                            }
-                        },
-                    },
-                    children=children_blocks,
-                )
-            elif task.name == "Home":
-                children_blocks = markdown_to_notion_blocks(task.description)
-                notion.pages.create(
-                    parent={"database_id": "c8a2c83ac85b4fe08b36bf631604f017"},
-                    properties={
-                        "title": {"title": [{"type": "text", "text": {"content": task.content}}]},
-                        "Team": {"select": {"name": task.name}},
-                        # Add a deadline date to the Deadline property where Start Date is current datetime and end date is 5pm EST today
-                        "Deadline": {
-                            "date": {
-                                "start": str(datetime.now()),
-                                "end": str(datetime.now() + timedelta(minutes=30)),
-                            }
-                        },
-                    },
-                    children=children_blocks,
-                )
-            elif task.project_id == "Weight":
-                # Add to the Weight database where the Weight property gets the number in task.content
-                notion.pages.create(
-                    parent={"database_id": "17f1c81bc0e04694a6d546173135b2ac"},
-                    properties={
-                        "Weight": {"number": float(task.content)},
-                        "Date": {"date": {"start": str(datetime.now().date())}},
-                    },
-                )
+    errors = {}
+    actions = {}
+    for task, action, error in results:
+        if error is None:
             list_task_dict.append(task)
-        except Exception as error:
-            return {"statusCode": 500, "body": json.dumps({"error": str(error)})}
+            actions[action] = actions.get(action, 0) + 1
+        else:
+            task_id = task.get("id") if isinstance(task, dict) else None
+            print(f"error writing task {task_id} to Notion: {error}")
+            refresh_secret_on_auth_error(error, "notion_token", "us-east-2")
+            errors[task_id] = str(error)
+
+    print(f"notion results: {actions}, {len(errors)} failed")
+    for action, count in actions.items():
+        metrics.count(f"pages_{action}", count)
+    # Pages already written are recorded in the index, so retrying a failed
+    # Map-state chunk only redoes the failed tasks
+    if errors and "chunk" in event:
+        raise ChunkFailed(f"{len(errors)} of {len(results)} tasks failed: {next(iter(errors.values()))}")
+    if errors and not list_task_dict:
+        return {"statusCode": 500, "body": json.dumps({"error": next(iter(errors.values())), "errors": errors})}
 
-    return {"statusCode": 200, "body": tasks_to_json(list_task_dict)}
+    with metrics.phase("serialize"):
+        body, summary = dump_tasks(list_task_dict, "putNotion")
+    return chunk_response(event, {"statusCode": 200, "body": body, "summary": summary})
 
 
 if __name__ == "__main__":
@@ -1,22 +1,80 @@
 import json
+import os
+import uuid
 
-from todoist_api_python.api import TodoistAPI
-from utils import SuperTask, get_secret
+from instrumentation import metrics
+from todoist_api_python.endpoints import get_sync_url
+from todoist_api_python.headers import create_headers
+from utils import HTTP_TIMEOUT, ChunkFailed, CompactTask, chunk_response, get_secret, get_todoist_session, iter_tasks, refresh_secret_on_auth_error
 
+# Maximum number of commands the Sync API accepts per request
+SYNC_COMMAND_LIMIT = 100
+# Overridable so the pipeline can run against a local fake Todoist
+SYNC_URL = os.environ.get("TODOIST_SYNC_URL", get_sync_url("sync"))
 
+
+def close_command_uuid(task: CompactTask) -> str:
+    """Deterministic command uuid so a retried batch is de-duplicated by Todoist.
+
+    The due date is part of the seed because closing a recurring task keeps its
+    id and only moves the due date; the next occurrence must get a new uuid.
+    """
+    due_date = task.due.get("date", "") if task.due else ""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"todoist:item_close:{task.id}:{due_date}"))
+
+
+def close_tasks(todoist_api_key, tasks, session=None) -> dict:
+    """Close ``tasks`` with batched ``item_close`` Sync API commands.
+
+    Returns a dict mapping each task id to ``"ok"`` or an error message.
+    """
+    session = session or get_todoist_session()
+    results = {}
+    for start in range(0, len(tasks), SYNC_COMMAND_LIMIT):
+        chunk = tasks[start : start + SYNC_COMMAND_LIMIT]
+        commands = [{"type": "item_close", "uuid": close_command_uuid(task), "args": {"id": task.id}} for task in chunk]
+        try:
+            with metrics.phase("call.todoist"):
+                response = session.post(
+                    SYNC_URL,
+                    headers=create_headers(token=todoist_api_key),
+                    data={"commands": json.dumps(commands)},
+                    timeout=HTTP_TIMEOUT,
+                )
+                response.raise_for_status()
+                sync_status = response.json().get("sync_status", {})
+        except Exception as error:
+            refresh_secret_on_auth_error(error, "todoist_key", "us-east-2")
+            for task in chunk:
+                results[task.id] = str(error)
+            continue
+
+        for task, command in zip(chunk, commands):
+            status = sync_status.get(command["uuid"], "missing sync_status")
+            results[task.id] = status if status == "ok" else json.dumps(status)
+    return results
+
+
+@metrics.handler("putTodoist")
 def lambda_handler(event, context):
-    task = json.loads(event["body"])
-    secret = get_secret("todoist_key", "us-east-2")
+    with metrics.phase("secret"):
+        secret = get_secret("todoist_key", "us-east-2")
     secret_dict = json.loads(secret)
     todoist_api_key = secret_dict["TODOIST_API_KEY"]
-    api = TodoistAPI(todoist_api_key)
 
-    for json_task in json.loads(event["body"]):
-        try:
-            print(f"\njson_task: {json_task}")
-            task = SuperTask(**json_task)
-            is_success = api.close_task(task_id=task.id)
-            print(is_success)
-        except Exception as error:
-            return {"statusCode": 500, "body": json.dumps({"error": str(error)})}
-    return {"statusCode": 200, "body": json.dumps({"message": "Task deleted"})}
+    tasks = []
+    for json_task in iter_tasks(event["body"]):
+        print(f"\njson_task: {json_task}")
+        tasks.append(CompactTask.from_dict(json_task))
+
+    results = close_tasks(todoist_api_key, tasks)
+    print(f"close results: {results}")
+
+    failed = {task_id: status for task_id, status in results.items() if status != "ok"}
+    metrics.count("tasks_closed", len(results) - len(failed))
+    if failed and "chunk" in event:
+        # Close commands use deterministic uuids, so the retried chunk does not double-close
+        raise ChunkFailed(f"Failed to close {len(failed)} of {len(results)} tasks: {json.dumps(failed)}")
+    if failed:
+        return {"statusCode": 500, "body": json.dumps({"error": "Failed to close some tasks", "results": results})}
+    return chunk_response(event, {"statusCode": 200, "body": json.dumps({"message": "Task deleted", "results": results})})
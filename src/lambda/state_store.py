@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+
+from aws_clients import get_client
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+# BatchGetItem and BatchWriteItem accept at most this many keys per request
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+# Serialises read-modify-write of the JSON files between threads, e.g. the
+# concurrent chunks of benchmarks/local_workflow.py sharing one state directory
+_file_lock = threading.Lock()
+
+
+class FileStateStore:
+    """Namespaced key/value store persisted as a JSON file.
+
+    Used as the local stand-in for the DynamoDB state table. On Lambda the file
+    lives under /tmp, so it survives warm invocations of the same container only.
+    When ``max_items`` is set the least recently written entries are evicted.
+    """
+
+    def __init__(self, namespace, directory=None, max_items=None):
+        directory = directory or os.environ.get("PIPELINE_STATE_DIR", "/tmp")
+        self.path = os.path.join(directory, f"{namespace}.json")
+        self.max_items = max_items
+        self._items = None
+
+    def _load(self):
+        if self._items is None:
+            try:
+                with open(self.path) as file:
+                    self._items = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._items = {}
+        return self._items
+
+    def _flush(self):
+        now = time.time()
+        expired = [key for key, record in self._items.items() if record.get("expiry") and record["expiry"] < now]
+        for key in expired:
+            del self._items[key]
+        if self.max_items and len(self._items) > self.max_items:
+            by_age = sorted(self._items, key=lambda key: self._items[key]["updatedAt"])
+            for key in by_age[: len(self._items) - self.max_items]:
+                del self._items[key]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._items, file)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key):
+        record = self._load().get(key)
+        if record is None:
+            return None
+        if record.get("expiry") and record["expiry"] < time.time():
+            return None
+        return record["value"]
+
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def put(self, key, value, ttl=None):
+        self.put_many({key: value}, ttl=ttl)
+
+    def put_many(self, values, ttl=None):
+        if not values:
+            return
+        with _file_lock:
+            # Re-read so entries written by other store instances are kept
+            self._items = None
+            items = self._load()
+            expiry = int(time.time() + ttl) if ttl else None
+            for key, value in values.items():
+                items[key] = {"value": value, "expiry": expiry, "updatedAt": time.time()}
+            self._flush()
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        with _file_lock:
+            self._items = None
+            items = self._load()
+            removed = [key for key in keys if items.pop(key, None) is not None]
+            if removed:
+                self._flush()
+
+
+class DynamoStateStore:
+    """Namespaced key/value store backed by the pipeline state DynamoDB table.
+
+    Items are keyed on ``pk = "<namespace>#<key>"`` with the value stored as a JSON
+    string and an optional ``expiry`` epoch used by the table's TTL. Requests go
+    through the container's shared low-level client (aws_clients.get_client).
+    """
+
+    _serializer = TypeSerializer()
+    _deserializer = TypeDeserializer()
+
+    def __init__(self, namespace, table_name):
+        self.namespace = namespace
+        self.table_name = table_name
+        self.client = get_client("dynamodb")
+
+    def _pk(self, key):
+        return f"{self.namespace}#{key}"
+
+    def _key(self, key):
+        return {"pk": {"S": self._pk(key)}}
+
+    def get(self, key):
+        response = self.client.get_item(TableName=self.table_name, Key=self._key(key))
+        return self._decode(response.get("Item"))
+
+    def get_many(self, keys):
+        keys = list(dict.fromkeys(keys))
+        values = {}
+        prefix_len = len(self.namespace) + 1
+        for start in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {self.table_name: {"Keys": [self._key(key) for key in keys[start : start + BATCH_GET_LIMIT]]}}
+            while request:
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    value = self._decode(item)
+                    if value is not None:
+                        values[item["pk"]["S"][prefix_len:]] = value
+                request = response.get("UnprocessedKeys")
+        return values
+
+    def put(self, key, value, ttl=None):
+        self.client.put_item(TableName=self.table_name, Item=self._encode(key, value, ttl))
+
+    def put_many(self, values, ttl=None):
+        self._batch_write([{"PutRequest": {"Item": self._encode(key, value, ttl)}} for key, value in values.items()])
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key=self._key(key))
+
+    def delete_many(self, keys):
+        self._batch_write([{"DeleteRequest": {"Key": self._key(key)}} for key in dict.fromkeys(keys)])
+
+    def _batch_write(self, requests):
+        for start in range(0, len(requests), BATCH_WRITE_LIMIT):
+            pending = requests[start : start + BATCH_WRITE_LIMIT]
+            attempt = 0
+            while pending:
+                if attempt:
+                    # Unprocessed items come back when the table is throttling
+                    time.sleep(min(1.0, 0.05 * 2**attempt))
+                response = self.client.batch_write_item(RequestItems={self.table_name: pending})
+                pending = response.get("UnprocessedItems", {}).get(self.table_name, [])
+                attempt += 1
+
+    def _encode(self, key, value, ttl):
+        item = {"pk": self._pk(key), "value": json.dumps(value), "updatedAt": int(time.time())}
+        if ttl:
+            item["expiry"] = int(time.time() + ttl)
+        return {name: self._serializer.serialize(attribute) for name, attribute in item.items()}
+
+    @classmethod
+    def _decode(cls, item):
+        if not item:
+            return None
+        item = {name: cls._deserializer.deserialize(attribute) for name, attribute in item.items()}
+        # TTL deletion is lazy, so expired items can still be returned for a while
+        if "expiry" in item and int(item["expiry"]) < time.time():
+            return None
+        return json.loads(item["value"])
+
+
+def get_state_store(namespace, max_items=None):
+    """Return the DynamoDB store when PIPELINE_STATE_TABLE is set, else the file store.
+
+    ``max_items`` bounds the file store only; DynamoDB entries are bounded by TTL.
+    """
+    table_name = os.environ.get("PIPELINE_STATE_TABLE")
+    if table_name:
+        return DynamoStateStore(namespace, table_name)
+    return FileStateStore(namespace, max_items=max_items)
@@ -0,0 +1,40 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils import iter_notion_blocks, iter_stream_lines, markdown_to_notion_blocks  # noqa: E402
+
+
+def outline(blocks):
+    """(type, text, children) tuples of ``blocks``, for comparing structure."""
+    return [(block["type"], "".join(part["text"]["content"] for part in block[block["type"]]["rich_text"]), outline(block[block["type"]].get("children", []))) for block in blocks]
+
+
+def test_sibling_list_items_are_all_kept():
+    assert outline(markdown_to_notion_blocks("- a\n- b\n- c")) == [
+        ("bulleted_list_item", "a", []),
+        ("bulleted_list_item", "b", []),
+        ("bulleted_list_item", "c", []),
+    ]
+
+
+def test_nested_list_items_attach_to_their_parent():
+    markdown = "1. one\n2. two\n   - sub\n     - subsub\n   - sub2\n3. three\nPara"
+    assert outline(markdown_to_notion_blocks(markdown)) == [
+        ("numbered_list_item", "one", []),
+        ("numbered_list_item", "two", [("bulleted_list_item", "sub", [("bulleted_list_item", "subsub", [])]), ("bulleted_list_item", "sub2", [])]),
+        ("numbered_list_item", "three", []),
+        ("paragraph", "Para", []),
+    ]
+
+
+def test_nesting_is_capped_at_max_depth():
+    markdown = "- a\n  - b\n    - c\n      - d"
+    assert outline(markdown_to_notion_blocks(markdown)) == [("bulleted_list_item", "a", [("bulleted_list_item", "b", [("bulleted_list_item", "c", []), ("bulleted_list_item", "d", [])])])]
+
+
+def test_streamed_chunks_give_the_same_blocks():
+    markdown = "Intro\n- a\n- b\n  - b1\n- c\n\n```python\nx = 1\n```\nDone"
+    chunks = [markdown[start : start + 3] for start in range(0, len(markdown), 3)]
+    assert list(iter_notion_blocks(iter_stream_lines(chunks))) == markdown_to_notion_blocks(markdown)
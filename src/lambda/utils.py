@@ -1,144 +1,520 @@
+import importlib.util
+import io
 import json
+import os
+import random
 import re
-from dataclasses import asdict, dataclass
+import threading
+import time
 from typing import List
 
-import boto3
+from aws_clients import HTTP_CONNECT_TIMEOUT, HTTP_POOL_SIZE, HTTP_READ_TIMEOUT, get_client
 from botocore.exceptions import ClientError
+from instrumentation import lazy_import, metrics
+from payload_store import get_payload_store, iter_payload_lines
 
+try:
+    import orjson
+except ImportError:  # optional: faster task (de)serialization when installed
+    orjson = None
 
-@dataclass
-class Task:
-    assignee_id: str
-    assigner_id: str
-    comment_count: int
-    is_completed: bool
-    content: str
-    created_at: str
-    creator_id: str
-    description: str
-    due: dict
-    id: str
-    labels: list
-    order: int
-    parent_id: str
-    priority: int
-    project_id: str
-    section_id: str
-    url: str
-    duration: str
-    sync_id: str
-
-
-@dataclass
-class SuperTask(Task):
-    agent_output: str = ""
-    passChatGPT: bool = True
-    name: str = ""
-
-    def __init__(self, agent_output="", passChatGPT=True, name="", **kwargs):
-        super().__init__(**kwargs)
+
+# Fields the pipeline stages actually read; everything else Todoist returns is dropped
+TASK_FIELDS = ("id", "content", "description", "project_id", "section_id", "due", "agent_output", "passChatGPT", "name")
+
+
+class CompactTask:
+    """Task as passed between the pipeline stages.
+
+    Slotted and limited to TASK_FIELDS, so the Step Functions payload and the
+    per-task memory stay small. ``from_dict`` ignores unknown keys, so full
+    Todoist task dicts (e.g. recorded payloads) still load.
+    """
+
+    __slots__ = TASK_FIELDS
+
+    def __init__(self, id, content, description="", project_id=None, section_id=None, due=None, agent_output="", passChatGPT=True, name=""):
+        self.id = id
+        self.content = content
+        self.description = description
+        self.project_id = project_id
+        self.section_id = section_id
+        self.due = due
         self.agent_output = agent_output
         self.passChatGPT = passChatGPT
         self.name = name
 
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["content"], data.get("description") or "", data.get("project_id"), data.get("section_id"), data.get("due"), data.get("agent_output") or "", data.get("passChatGPT", True), data.get("name") or "")
+
+    def to_dict(self):
+        return {"id": self.id, "content": self.content, "description": self.description, "project_id": self.project_id, "section_id": self.section_id, "due": self.due, "agent_output": self.agent_output, "passChatGPT": self.passChatGPT, "name": self.name}
+
+    def __repr__(self):
+        return f"CompactTask(id={self.id!r}, project_id={self.project_id!r}, section_id={self.section_id!r}, content={self.content!r})"
+
+
+def json_dumps(value) -> str:
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(",", ":"))
+
+
+def json_loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def tasks_to_json(tasks: List[CompactTask]) -> str:
+    return json_dumps([task.to_dict() for task in tasks])
+
+
+def tasks_from_json(text) -> List[CompactTask]:
+    return [CompactTask.from_dict(task_dict) for task_dict in json_loads(text)]
+
+
+# Batches larger than this (encoded bytes) are offloaded to the payload store and
+# only a claim check travels through Step Functions, whose state limit is 256 KB
+CLAIM_CHECK_BYTES = int(os.environ.get("PIPELINE_CLAIM_CHECK_BYTES", str(128 * 1024)))
+
+
+class ChunkFailed(Exception):
+    """Raised by a stage when a task of a Map-state chunk fails, so Step Functions retries just that chunk."""
+
+
+def chunk_response(event, response):
+    """Carry the Map-state chunk index of ``event`` over to the stage's response."""
+    if event and "chunk" in event:
+        response["chunk"] = event["chunk"]
+    return response
+
+
+def _encode_tasks(tasks: List[CompactTask]):
+    lines = [json_dumps(task.to_dict()) for task in tasks]
+    return lines, sum(len(line.encode()) for line in lines) + len(lines) + 1
+
+
+def dump_tasks(tasks: List[CompactTask], stage: str):
+    """Encode a batch for the next stage, returning ``(body, summary)``.
 
-def tasks_to_json(tasks: List[SuperTask]) -> str:
-    tasks_dict = []
-    for task in tasks:
-        # if task.project_id == "2334637095":  # Biftu
-        task_dict = asdict(task)
-        tasks_dict.append(task_dict)
-    return json.dumps(tasks_dict)
+    Small batches are inlined as a JSON array. Larger ones are written once to
+    the payload store as gzip newline-delimited JSON and the body is just
+    ``{"claimCheck": {"uri": ..., "count": ..., ...}}``. The summary is also
+    returned next to the body so the state machine can branch on it.
+    """
+    lines, size = _encode_tasks(tasks)
+    summary = {"count": len(lines), "bytes": size}
+    if size <= CLAIM_CHECK_BYTES:
+        return "[" + ",".join(lines) + "]", summary
+    uri, compressed = get_payload_store().write_lines(stage, lines)
+    summary["compressedBytes"] = compressed
+    print(f"claim check: {len(lines)} tasks, {size} bytes -> {uri} ({compressed} bytes)")
+    return json_dumps({"claimCheck": {"uri": uri, **summary}}), summary
+
+
+def dump_chunks(tasks: List[CompactTask], stage: str, chunk_size: int):
+    """Split a batch into Map-state items of at most ``chunk_size`` tasks, returning ``(chunks, summary)``.
+
+    Each chunk is ``{"chunk": index, "body": ..., "summary": ...}`` and is a valid
+    event for the downstream stages. When the whole batch is over
+    CLAIM_CHECK_BYTES every chunk is claim-checked, so the item list stays small.
+    """
+    lines, size = _encode_tasks(tasks)
+    store = get_payload_store() if size > CLAIM_CHECK_BYTES else None
+    chunks = []
+    for index, start in enumerate(range(0, len(lines), chunk_size)):
+        chunk_lines = lines[start : start + chunk_size]
+        chunk_summary = {"count": len(chunk_lines)}
+        if store is None:
+            body = "[" + ",".join(chunk_lines) + "]"
+        else:
+            uri, chunk_summary["compressedBytes"] = store.write_lines(stage, chunk_lines)
+            body = json_dumps({"claimCheck": {"uri": uri, **chunk_summary}})
+        chunks.append({"chunk": index, "body": body, "summary": chunk_summary})
+    return chunks, {"count": len(lines), "bytes": size, "chunks": len(chunks)}
+
+
+def iter_tasks(body):
+    """Yield the task dicts of a stage body, whether inline or claim-checked.
+
+    Claim-checked payloads are streamed line by line instead of being loaded whole.
+    """
+    payload = json_loads(body)
+    if isinstance(payload, dict) and "claimCheck" in payload:
+        for line in iter_payload_lines(payload["claimCheck"]["uri"]):
+            yield json_loads(line)
+    else:
+        yield from payload
+
+
+# Notion rejects rich text objects whose content is longer than this
+RICH_TEXT_LIMIT = 2000
+# Deepest children nesting Notion accepts in a single create/append request
+MAX_LIST_DEPTH = 2
+NOTION_CODE_LANGUAGES = {"bash", "c", "c++", "c#", "css", "go", "html", "java", "javascript", "json", "markdown", "plain text", "python", "ruby", "rust", "shell", "sql", "typescript", "yaml"}
+
+INLINE_PATTERN = re.compile(r"`(?P<code>[^`]+)`" r"|\*\*(?P<bold>.+?)\*\*" r"|(?<![\w*])\*(?P<italic>[^*\s][^*]*?)\*" r"|(?<!\w)_(?P<italic_alt>[^_\s][^_]*?)_(?!\w)" r"|\[(?P<link_text>[^\]]+)\]\((?P<link_url>[^)\s]+)\)")
+INLINE_MARKERS = re.compile(r"[`*_\[]")
+HEADING_PATTERN = re.compile(r"(#{1,6})\s+(.*)")
+BULLET_PATTERN = re.compile(r"([ \t]*)[-*+]\s+(.*)")
+NUMBERED_PATTERN = re.compile(r"([ \t]*)\d+[.)](?:\s+(.*)|$)")
+FENCE_PATTERN = re.compile(r"\s*```\s*([\w+#-]*)")
+LIST_MARKERS = frozenset("-*+0123456789")
+
+
+def _text(parts, content, annotations=None, url=None):
+    """Append rich text objects for ``content`` to ``parts``, split to respect RICH_TEXT_LIMIT."""
+    if len(content) <= RICH_TEXT_LIMIT and not annotations and not url:
+        parts.append({"type": "text", "text": {"content": content}})
+        return parts
+    for start in range(0, len(content), RICH_TEXT_LIMIT):
+        part = {"type": "text", "text": {"content": content[start : start + RICH_TEXT_LIMIT]}}
+        if url:
+            part["text"]["link"] = {"url": url}
+        if annotations:
+            part["annotations"] = annotations
+        parts.append(part)
+    return parts
 
 
 def parse_inline_formatting(text):
+    """Convert inline markdown (bold, italics, code, links) to Notion rich text."""
     parts = []
-    bold_pattern = r"\*\*(.*?)\*\*"
+    if not INLINE_MARKERS.search(text):
+        return _text(parts, text) if text else parts
 
     last_end = 0
-    for match in re.finditer(bold_pattern, text):
+    for match in INLINE_PATTERN.finditer(text):
         if match.start() > last_end:
-            parts.append({"type": "text", "text": {"content": text[last_end : match.start()]}})
+            _text(parts, text[last_end : match.start()])
 
-        parts.append({"type": "text", "text": {"content": match.group(1)}, "annotations": {"bold": True}})
+        kind = match.lastgroup
+        if kind == "code":
+            _text(parts, match.group("code"), {"code": True})
+        elif kind == "bold":
+            _text(parts, match.group("bold"), {"bold": True})
+        elif kind in ("italic", "italic_alt"):
+            _text(parts, match.group(kind), {"italic": True})
+        else:
+            _text(parts, match.group("link_text"), url=match.group("link_url"))
 
         last_end = match.end()
 
     if last_end < len(text):
-        parts.append({"type": "text", "text": {"content": text[last_end:]}})
+        _text(parts, text[last_end:])
 
     return parts
 
 
-def markdown_to_notion_blocks(markdown_content):
-    blocks = []
-    lines = markdown_content.split("\n")
+def _block(block_type, rich_text, **extra):
+    return {"object": "block", "type": block_type, block_type: {"rich_text": rich_text, **extra}}
+
+
+def _indent_width(indent):
+    return len(indent.expandtabs(4))
+
+
+def iter_notion_blocks(lines):
+    """Convert markdown lines to Notion blocks in a single pass.
+
+    ``lines`` can be any iterable (a file, a stream of completion chunks split
+    into lines, ...). Blocks are yielded as soon as they are complete; a list
+    item is held back only until its nested items have been read.
+    """
+    # Open list items as (indent, block); the first entry is the top-level item
+    list_stack = []
+    code_language = None
+    code_lines = []
 
-    list_number = 0
     for line in lines:
-        if line.strip() == "":
-            list_number = 0  # Reset list numbering on empty lines
+        line = line.rstrip("\r\n")
+
+        if code_language is not None:
+            if FENCE_PATTERN.fullmatch(line):
+                yield _block("code", _text([], "\n".join(code_lines)), language=code_language)
+                code_language = None
+                code_lines = []
+            else:
+                code_lines.append(line)
+            continue
+
+        stripped = line.lstrip()
+        first = stripped[:1]
+        list_match = None
+        if first in LIST_MARKERS:
+            list_match = BULLET_PATTERN.fullmatch(line) or NUMBERED_PATTERN.fullmatch(line)
+        if list_match:
+            block_type = "bulleted_list_item" if list_match.re is BULLET_PATTERN else "numbered_list_item"
+            block = _block(block_type, parse_inline_formatting(list_match.group(2) or ""))
+            indent = _indent_width(list_match.group(1))
+            while list_stack and list_stack[-1][0] >= indent:
+                # A sibling of the top-level item completes it
+                if len(list_stack) == 1:
+                    yield list_stack[0][1]
+                list_stack.pop()
+            while len(list_stack) > MAX_LIST_DEPTH:
+                list_stack.pop()
+            if list_stack:
+                parent = list_stack[-1][1]
+                parent[parent["type"]].setdefault("children", []).append(block)
+            list_stack.append((indent, block))
+            continue
+
+        # Any other line closes the open list
+        if list_stack:
+            yield list_stack[0][1]
+            list_stack = []
+
+        if not stripped:
             continue
 
-        # Check for headings
-        if line.startswith("#"):
-            level = len(line.split()[0])
-            content = line.lstrip("#").strip()
-            blocks.append(
-                {
-                    "object": "block",
-                    "type": f"heading_{level}",
-                    f"heading_{level}": {"rich_text": parse_inline_formatting(content)},
-                }
-            )
-            list_number = 0  # Reset list numbering after headings
-
-        # Check for bullet lists
-        elif line.strip().startswith("- "):
-            content = line.strip()[2:]
-            blocks.append(
-                {
-                    "object": "block",
-                    "type": "bulleted_list_item",
-                    "bulleted_list_item": {"rich_text": parse_inline_formatting(content)},
-                }
-            )
-            list_number = 0  # Reset list numbering for bullet lists
-
-        # Check for numbered lists
-        elif re.match(r"^\d+\.", line.strip()):
-            list_number += 1
-            content = re.sub(r"^\d+\.", "", line).strip()
-            blocks.append(
-                {
-                    "object": "block",
-                    "type": "numbered_list_item",
-                    "numbered_list_item": {"rich_text": parse_inline_formatting(content)},
-                }
-            )
-
-        # Everything else as a paragraph
+        fence_match = FENCE_PATTERN.match(line) if first == "`" else None
+        if fence_match:
+            language = fence_match.group(1).lower()
+            code_language = language if language in NOTION_CODE_LANGUAGES else "plain text"
+            continue
+
+        heading_match = HEADING_PATTERN.fullmatch(stripped.rstrip()) if first == "#" else None
+        if heading_match:
+            level = min(len(heading_match.group(1)), 3)
+            yield _block(f"heading_{level}", parse_inline_formatting(heading_match.group(2).strip()))
         else:
-            blocks.append({"object": "block", "type": "paragraph", "paragraph": {"rich_text": parse_inline_formatting(line)}})
-            list_number = 0  # Reset list numbering for paragraphs
+            yield _block("paragraph", parse_inline_formatting(line))
+
+    if list_stack:
+        yield list_stack[0][1]
+    if code_language is not None:
+        # Unterminated fence: keep the content rather than dropping it
+        yield _block("code", _text([], "\n".join(code_lines)), language=code_language)
+
+
+def iter_stream_lines(chunks):
+    """Re-split streamed text pieces into lines, yielding each line once it is complete."""
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        if "\n" in buffer:
+            *lines, buffer = buffer.split("\n")
+            yield from lines
+    if buffer:
+        yield buffer
+
+
+def markdown_to_notion_blocks(markdown_content):
+    return list(iter_notion_blocks(io.StringIO(markdown_content)))
+
+
+class ConfigRegistry:
+    """Per-container view of config.json and the system prompts it references.
+
+    Everything is read once and indexed by project_id / section_id. Files are
+    re-checked by mtime at most every ``reload_interval`` seconds, so warm
+    invocations in between do no file I/O at all.
+    """
+
+    def __init__(self, config_path="config.json", reload_interval=60):
+        self.config_path = config_path
+        self.reload_interval = reload_interval
+        self._mtimes = {}
+        self._checked_at = None
+        self.projects = {}
+        self.prompts = {}
+
+    def _load(self):
+        with open(self.config_path) as file:
+            config = json.load(file)
+        mtimes = {self.config_path: os.path.getmtime(self.config_path)}
+        prompts = {}
+        for section in config.get("sections", []):
+            with open(section["prompt_file"]) as file:
+                prompts[str(section["section_id"])] = file.read()
+            mtimes[section["prompt_file"]] = os.path.getmtime(section["prompt_file"])
+        self.projects = {int(project["project_id"]): project for project in config["projects"]}
+        self.prompts = prompts
+        self._mtimes = mtimes
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        if not self._mtimes or any(os.path.getmtime(path) != mtime for path, mtime in self._mtimes.items()):
+            self._load()
+
+    @property
+    def project_id_list(self):
+        self._refresh()
+        return list(self.projects)
+
+    def project(self, project_id):
+        self._refresh()
+        return self.projects.get(int(project_id))
+
+    def system_prompt(self, section_id):
+        self._refresh()
+        return self.prompts.get(str(section_id), "")
+
+
+config_registry = ConfigRegistry(reload_interval=float(os.environ.get("CONFIG_RELOAD_INTERVAL", "60")))
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursting up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        # Requests larger than the bucket would never be satisfied; clamp them
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._blocked_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = max(self._blocked_until - now, (tokens - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Block all callers for ``seconds``, e.g. when the server sends Retry-After."""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+def backoff_delay(attempt, base=1.0, cap=30.0):
+    """Exponential backoff with full jitter for the given (zero-based) retry attempt."""
+    return random.uniform(0, min(cap, base * 2**attempt))
 
-    return blocks
 
+# Process-wide secret values, reused across warm invocations (boto3 clients: aws_clients)
+_secret_cache = {}
+SECRET_CACHE_TTL = float(os.environ.get("SECRET_CACHE_TTL", "900"))
+secret_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
 
-def get_secret(secret_name, region_name):
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
+# Idle connections are dropped after this many seconds; a warm container that is
+# invoked every 15 minutes by the scheduler needs a longer expiry to benefit
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "1200"))
+HTTP2 = os.environ.get("HTTP2", "1") != "0"
+# (connect, read) timeout for requests calls, which have no session-wide default
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+_api_clients = {}
+_api_clients_lock = threading.Lock()
+
+
+def get_api_client(name, secret, build):
+    """Return the client ``build(secret)`` made for ``name``, shared across warm invocations.
+
+    The client is rebuilt only when ``secret`` differs from the one it was built
+    with, i.e. after a rotation picked up through refresh_secret_on_auth_error;
+    the replaced client is closed.
+    """
+    with _api_clients_lock:
+        cached = _api_clients.get(name)
+        if cached is not None and cached[0] == secret:
+            return cached[1]
+        with metrics.phase("client_init"):
+            client = build(secret)
+        _api_clients[name] = (secret, client)
+    if cached is not None and hasattr(cached[1], "close"):
+        cached[1].close()
+    return client
+
+
+def http_client():
+    """httpx client with the shared pool settings, for the OpenAI and Notion SDKs.
+
+    HTTP/2 is used when the optional ``h2`` package is installed.
+    """
+    httpx = lazy_import("httpx")
+    http2 = HTTP2 and importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+    return httpx.Client(limits=limits, timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT), http2=http2)
+
+
+def http_session():
+    """requests session with the shared pool size, for the Todoist SDK and Sync API calls."""
+    requests = lazy_import("requests")
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_openai_client(api_key):
+    # Retries are left to putChatGPT.create_completion so they respect the shared rate budget
+    return get_api_client("openai", api_key, lambda key: lazy_import("openai").OpenAI(api_key=key, max_retries=0, timeout=HTTP_READ_TIMEOUT, http_client=http_client()))
+
+
+def get_notion_client(token, base_url):
+    return get_api_client("notion", (token, base_url), lambda secret: lazy_import("notion_client").Client(auth=secret[0], base_url=secret[1], timeout_ms=int(HTTP_READ_TIMEOUT * 1000), client=http_client()))
+
+
+def get_todoist_client(api_key):
+    return get_api_client("todoist", api_key, lambda key: lazy_import("todoist_api_python.api").TodoistAPI(key, session=http_session()))
+
+
+def get_todoist_session():
+    """Shared session for direct Sync API requests; the token goes in each request's headers."""
+    return get_api_client("todoist_sync", None, lambda _: http_session())
+
+
+def get_secret(secret_name, region_name, force_refresh=False):
+    key = (secret_name, region_name)
+    cached = _secret_cache.get(key)
+    if cached and not force_refresh and time.monotonic() - cached[1] < SECRET_CACHE_TTL:
+        secret_cache_stats["hits"] += 1
+        return cached[0]
+
+    secret_cache_stats["misses"] += 1
+    client = get_client("secretsmanager", region_name)
 
     try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
+        with metrics.phase("call.secretsmanager"):
+            get_secret_value_response = client.get_secret_value(SecretId=secret_name)
     except ClientError as e:
         # For a list of exceptions thrown, see
         # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
         raise e
 
-    return get_secret_value_response["SecretString"]
+    secret_string = get_secret_value_response["SecretString"]
+    _secret_cache[key] = (secret_string, time.monotonic())
+    return secret_string
+
+
+def invalidate_secret(secret_name, region_name):
+    """Drop a cached secret so the next get_secret call fetches it again."""
+    if _secret_cache.pop((secret_name, region_name), None) is not None:
+        secret_cache_stats["invalidations"] += 1
+
+
+def is_auth_error(error):
+    """True for 401/403 responses from the OpenAI, Notion, Todoist (requests) or AWS clients."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status is None and isinstance(response, dict):
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return status in (401, 403)
+
+
+def refresh_secret_on_auth_error(error, secret_name, region_name):
+    """Invalidate the cached secret when ``error`` means it was rejected (e.g. after rotation)."""
+    if is_auth_error(error):
+        print(f"auth failure, invalidating cached secret {secret_name}")
+        invalidate_secret(secret_name, region_name)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+from instrumentation import metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Bounded fan-out of post_to_connection calls
+BROADCAST_MAX_WORKERS = int(os.environ.get("BROADCAST_MAX_WORKERS", "16"))
+
+
+def _is_gone(error):
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code") == "GoneException"
+    return "GoneException" in str(error)
+
+
+def broadcast(apigw_management, connections, message, connection_ids, max_workers=BROADCAST_MAX_WORKERS):
+    """Send ``message`` to ``connection_ids`` and prune the stale ones.
+
+    Posts go out through a bounded thread pool; connections that report
+    GoneException are deleted in a single batch afterwards. Returns counts of
+    delivered, failed and pruned connections.
+    """
+
+    def post(connection_id):
+        try:
+            with metrics.phase("call.apigateway"):
+                apigw_management.post_to_connection(ConnectionId=connection_id, Data=message)
+            return connection_id, None
+        except Exception as e:
+            return connection_id, e
+
+    stats = {"connections": len(connection_ids), "delivered": 0, "failed": 0, "pruned": 0}
+    stale = []
+    if connection_ids:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(connection_ids)))) as executor:
+            for connection_id, error in executor.map(post, connection_ids):
+                if error is None:
+                    stats["delivered"] += 1
+                elif _is_gone(error):
+                    stale.append(connection_id)
+                else:
+                    stats["failed"] += 1
+                    logger.error(f"Error posting to connection {connection_id}: {str(error)}")
+
+    if stale:
+        logger.info(f"Removing {len(stale)} stale connections")
+        connections.delete_many(stale)
+        stats["pruned"] = len(stale)
+
+    logger.info(f"Broadcast results: {stats}")
+    return stats
+
+
+def build_update_message(job):
+    """WebSocket payload for a parameter update job."""
+    return json.dumps({"type": "PARAMS_UPDATE", "data": {"paramId": job["paramId"], "mean": job["mean"], "stdDev": job["stdDev"], "updatedBy": job["updatedBy"], "userId": job["userId"], "timestamp": job.get("timestamp") or int(time.time() * 1000)}})
+
+
+def deliver_job(apigw_management, connections, job):
+    """Push one update job to the subscribers of its paramId."""
+    connection_ids = connections.subscriber_ids(job["paramId"])
+    return broadcast(apigw_management, connections, build_update_message(job), connection_ids=connection_ids)
+
+
+def coalesce_jobs(jobs):
+    """Keep only the most recent job per paramId so rapid successive updates are pushed once."""
+    latest = {}
+    for job in jobs:
+        current = latest.get(job["paramId"])
+        if current is None or job["timestamp"] >= current["timestamp"]:
+            latest[job["paramId"]] = job
+    return list(latest.values())
+
+
+class SqsBroadcastQueue:
+    """Broadcast jobs sent to the SQS queue consumed by the broadcastParams Lambda."""
+
+    def __init__(self, queue_url):
+        self.queue_url = queue_url
+        self.sqs = boto3.client("sqs")
+
+    def send(self, job):
+        self.sqs.send_message(QueueUrl=self.queue_url, MessageBody=json.dumps(job, default=str))
+
+
+class LocalBroadcastQueue:
+    """In-process stand-in for the SQS queue, for local runs and tests."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def send(self, job):
+        self.jobs.append(job)
+
+    def drain(self, apigw_management, connections):
+        """Deliver the queued jobs (coalesced per paramId) and empty the queue."""
+        jobs, self.jobs = self.jobs, []
+        return [deliver_job(apigw_management, connections, job) for job in coalesce_jobs(jobs)]
+
+
+def get_broadcast_queue(mode):
+    """Return the queue update jobs are handed to for ``BROADCAST_MODE`` ``mode``, or None to broadcast in-request.
+
+    "async" needs BROADCAST_QUEUE_URL; without it nothing would ever drain the jobs
+    inside Lambda, so updates fall back to the synchronous broadcast. The in-process
+    queue is only used when explicitly asked for with "local".
+    """
+    if mode == "local":
+        return LocalBroadcastQueue()
+    if mode != "async":
+        return None
+    queue_url = os.environ.get("BROADCAST_QUEUE_URL")
+    if queue_url:
+        return SqsBroadcastQueue(queue_url)
+    logger.warning("BROADCAST_MODE=async without BROADCAST_QUEUE_URL, broadcasting synchronously")
+    return None
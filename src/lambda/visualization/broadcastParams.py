@@ -0,0 +1,42 @@
+import json
+import boto3
+import os
+import logging
+from instrumentation import metrics
+from visualization import repository
+from visualization.broadcast import coalesce_jobs, deliver_job
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+apigw_management = boto3.client("apigatewaymanagementapi", endpoint_url=os.environ.get("WEBSOCKET_API_ENDPOINT"))
+
+
+@metrics.handler("broadcastParams")
+def lambda_handler(event, context):
+    """
+    Consumes parameter update jobs from the broadcast SQS queue and pushes them
+    to subscribed WebSocket clients. Jobs for the same paramId within a batch are
+    coalesced so only the latest value is sent.
+    """
+    records = event.get("Records", [])
+    jobs = []
+    message_ids = {}
+    for record in records:
+        job = json.loads(record["body"])
+        jobs.append(job)
+        message_ids.setdefault(job["paramId"], []).append(record["messageId"])
+
+    coalesced = coalesce_jobs(jobs)
+    logger.info(f"Broadcasting {len(coalesced)} updates coalesced from {len(jobs)} jobs")
+
+    # Report failures per message so SQS only redelivers the affected paramIds
+    failures = []
+    for job in coalesced:
+        try:
+            deliver_job(apigw_management, repository.connections(), job)
+        except Exception as e:
+            logger.error(f"Error broadcasting update for {job['paramId']}: {str(e)}")
+            failures.extend({"itemIdentifier": message_id} for message_id in message_ids[job["paramId"]])
+
+    return {"batchItemFailures": failures}
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+import math
+import base64
+from collections import OrderedDict
+import logging
+import numpy as np
+from instrumentation import metrics
+from visualization import repository
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_POINTS = 200
+MAX_POINTS = int(os.environ.get("CURVE_MAX_POINTS", "4096"))
+DEFAULT_RANGE = 4.0  # in standard deviations either side of the mean
+MAX_RANGE = 10.0
+# Computed curves keyed on (paramId, version, points, range); parameters are re-read
+# at most every CURVE_PARAMS_TTL seconds to learn the current version
+CURVE_CACHE_MAX_ITEMS = int(os.environ.get("CURVE_CACHE_MAX_ITEMS", "64"))
+PARAMS_TTL = float(os.environ.get("CURVE_PARAMS_TTL", "5"))
+curve_cache = OrderedDict()
+params_cache = {}
+
+COLUMNS = ["x", "pdf", "cdf"]
+
+
+class BadRequest(Exception):
+    pass
+
+
+def load_params(param_id):
+    """Current (mean, stdDev, version) of a parameter set, cached for PARAMS_TTL seconds."""
+    cached = params_cache.get(param_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    parameters = repository.parameters()
+    head = parameters.get_head(param_id)
+    if head:
+        params = (float(head["mean"]), float(head["stdDev"]), f"v{int(head['versionNumber'])}")
+    else:
+        item = parameters.get_latest(param_id)
+        # Same defaults as getVisualizationData when nothing has been stored yet
+        params = (float(item["mean"]), float(item["stdDev"]), item.get("version", str(item["timestamp"]))) if item else (0.0, 1.0, "default")
+
+    params_cache[param_id] = (time.monotonic() + PARAMS_TTL, params)
+    return params
+
+
+def erf(values):
+    # Abramowitz & Stegun 7.1.26, |error| < 1.5e-7, well below float32 resolution
+    sign = np.sign(values)
+    values = np.abs(values)
+    t = 1.0 / (1.0 + 0.3275911 * values)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-values * values))
+
+
+def compute_curve(mean, std_dev, points, width):
+    """Sample x, PDF and CDF of N(mean, std_dev) at ``points`` evenly spaced x values."""
+    x = np.linspace(mean - width * std_dev, mean + width * std_dev, points)
+    z = (x - mean) / std_dev
+    pdf = np.exp(-0.5 * z * z) / (std_dev * math.sqrt(2 * math.pi))
+    cdf = 0.5 * (1.0 + erf(z / math.sqrt(2)))
+    return np.column_stack((x, pdf, cdf))
+
+
+def get_curve(param_id, version, mean, std_dev, points, width):
+    key = (param_id, version, points, width)
+    curve = curve_cache.get(key)
+    if curve is None:
+        curve = compute_curve(mean, std_dev, points, width)
+        curve_cache[key] = curve
+        while len(curve_cache) > CURVE_CACHE_MAX_ITEMS:
+            curve_cache.popitem(last=False)
+    curve_cache.move_to_end(key)
+    return curve
+
+
+def downsample(curve, step):
+    """Every ``step``-th sample, always keeping the last one so the range is preserved."""
+    if step <= 1:
+        return curve
+    indices = np.arange(0, len(curve), step)
+    if indices[-1] != len(curve) - 1:
+        indices = np.append(indices, len(curve) - 1)
+    return curve[indices]
+
+
+def to_binary(curve):
+    """Row-major little-endian float32 array: x, pdf, cdf for each sample."""
+    return np.ascontiguousarray(curve, dtype="<f4").tobytes()
+
+
+def parse_number(query_params, name, default, cast, low, high):
+    value = query_params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        number = cast(value)
+    except ValueError as e:
+        raise BadRequest(f"{name} must be a number") from e
+    if not low <= number <= high:
+        raise BadRequest(f"{name} must be between {low} and {high}")
+    return number
+
+
+@metrics.handler("getVisualizationCurve")
+def lambda_handler(event, context):
+    """
+    Returns sampled PDF and CDF values of the normal distribution for a parameter set.
+
+    Query parameters:
+    - paramId: parameter set (default normal_distribution_params)
+    - points: number of samples (default 200, at most CURVE_MAX_POINTS)
+    - range: half-width of the sampled interval in standard deviations (default 4)
+    - downsample: keep every Nth sample
+    - format: "json" (default) or "binary" for a float32 array of x, pdf, cdf rows;
+      an Accept: application/octet-stream header also selects binary
+    """
+    try:
+        query_params = event.get("queryStringParameters", {}) or {}
+        headers = {name.lower(): value for name, value in (event.get("headers") or {}).items()}
+
+        param_id = query_params.get("paramId", "normal_distribution_params")
+        points = parse_number(query_params, "points", DEFAULT_POINTS, int, 2, MAX_POINTS)
+        width = parse_number(query_params, "range", DEFAULT_RANGE, float, 0.1, MAX_RANGE)
+        step = parse_number(query_params, "downsample", 1, int, 1, MAX_POINTS)
+        binary = query_params.get("format") == "binary" or (query_params.get("format") is None and "application/octet-stream" in (headers.get("accept") or ""))
+
+        mean, std_dev, version = load_params(param_id)
+        curve = downsample(get_curve(param_id, version, mean, std_dev, points, width), step)
+
+        response_headers = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "X-Curve-Version, X-Curve-Columns, X-Curve-Points", "X-Curve-Version": version, "X-Curve-Columns": ",".join(COLUMNS), "X-Curve-Points": str(len(curve))}
+        if binary:
+            return {"statusCode": 200, "headers": {**response_headers, "Content-Type": "application/octet-stream"}, "isBase64Encoded": True, "body": base64.b64encode(to_binary(curve)).decode()}
+
+        rows = curve.tolist()
+        body = {"paramId": param_id, "version": version, "mean": mean, "stdDev": std_dev, "points": len(rows)}
+        body.update({column: [row[i] for row in rows] for i, column in enumerate(COLUMNS)})
+        return {"statusCode": 200, "headers": {**response_headers, "Content-Type": "application/json"}, "body": json.dumps(body)}
+
+    except BadRequest as e:
+        return {"statusCode": 400, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": str(e)})}
+
+    except Exception as e:
+        logger.error(f"Error computing visualization curve: {str(e)}")
+        return {"statusCode": 500, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": str(e)})}
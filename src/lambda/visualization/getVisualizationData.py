@@ -1,22 +1,96 @@
 import json
-import boto3
 import os
-from boto3.dynamodb.conditions import Key
+import time
+import hashlib
+from collections import OrderedDict
 import logging
+from instrumentation import metrics
+from visualization import repository
+from visualization.repository import decimal_default
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-parameter_table = dynamodb.Table(os.environ.get("PARAMETER_TABLE"))
+# Per-container read-through cache of response bodies keyed on (paramId, userId).
+# Entries live for VIZ_CACHE_TTL seconds; clients revalidate with If-None-Match.
+CACHE_TTL = float(os.environ.get("VIZ_CACHE_TTL", "5"))
+CACHE_MAX_ITEMS = int(os.environ.get("VIZ_CACHE_MAX_ITEMS", "256"))
+response_cache = OrderedDict()
 
 
+def make_etag(param_id, items):
+    """Strong ETag derived from the paramId and version of every item in the response."""
+    versions = ",".join(f"{item.get('paramId', param_id)}:{item.get('version', item.get('timestamp'))}" for item in items) or f"{param_id}:default"
+    return '"' + hashlib.sha256(versions.encode()).hexdigest()[:32] + '"'
+
+
+def cache_get(key):
+    entry = response_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del response_cache[key]
+        return None
+    response_cache.move_to_end(key)
+    return entry[1], entry[2]
+
+
+def cache_put(key, body, etag):
+    response_cache[key] = (time.monotonic() + CACHE_TTL, body, etag)
+    response_cache.move_to_end(key)
+    while len(response_cache) > CACHE_MAX_ITEMS:
+        response_cache.popitem(last=False)
+
+
+def if_none_match(event):
+    """ETags listed in the request's If-None-Match header (header names are case-insensitive)."""
+    for name, value in (event.get("headers") or {}).items():
+        if name.lower() == "if-none-match" and value:
+            return {tag.strip().removeprefix("W/") for tag in value.split(",")}
+    return set()
+
+
+def build_response(event, body, etag):
+    headers = {"Access-Control-Allow-Origin": "*", "Access-Control-Expose-Headers": "ETag", "Content-Type": "application/json", "ETag": etag, "Cache-Control": "no-cache"}
+    requested = if_none_match(event)
+    if etag in requested or "*" in requested:
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    return {"statusCode": 200, "headers": headers, "body": body}
+
+
+def load_parameters(param_id, user_id):
+    """Query DynamoDB and return the response body and its ETag."""
+    # If a specific user ID is provided, query by user ID through the GSI
+    if user_id:
+        logger.info(f"Querying parameters for user: {user_id}")
+        items = repository.parameters().list_for_user(user_id, limit=10)  # Get most recent 10 parameter sets for the user
+
+        # If no results from user ID query, fall back to default parameters
+        if not items:
+            return json.dumps({"mean": 0, "stdDev": 1, "lastUpdatedBy": None, "lastUpdatedAt": None, "paramId": param_id, "userId": user_id}), make_etag(param_id, [])
+
+        # Return the user's parameters with additional metadata
+        return json.dumps({"parameters": items, "count": len(items)}, default=decimal_default), make_etag(param_id, items)
+
+    # Standard query by parameter ID when no user ID is specified
+    item = repository.parameters().get_latest(param_id)
+
+    # Default values if no custom parameters exist
+    if not item:
+        return json.dumps({"mean": 0, "stdDev": 1, "lastUpdatedBy": None, "lastUpdatedAt": None, "paramId": param_id}), make_etag(param_id, [])
+
+    # Return the current parameters
+    return json.dumps(item, default=decimal_default), make_etag(param_id, [item])
+
+
+@metrics.handler("getVisualizationData")
 def lambda_handler(event, context):
     """
     Retrieves the current normal distribution parameters.
     Returns default values if no parameters exist.
 
     Supports retrieving parameters by user ID when specified in the query parameters.
+    Responses carry an ETag; a matching If-None-Match header gets a 304 with no body.
     """
     try:
         # Extract user ID if provided in the query parameters
@@ -39,28 +113,13 @@ def lambda_handler(event, context):
         # Get parameter ID if specified, otherwise use default
         param_id = query_params.get("paramId", "normal_distribution_params")
 
-        # If a specific user ID is provided, query by user ID through the GSI
-        if user_id:
-            logger.info(f"Querying parameters for user: {user_id}")
-            response = parameter_table.query(IndexName="UserIdIndex", KeyConditionExpression=Key("userId").eq(user_id), Limit=10, ScanIndexForward=False)  # Get most recent 10 parameter sets for the user
-
-            # If no results from user ID query, fall back to default parameters
-            if not response.get("Items"):
-                return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"mean": 0, "stdDev": 1, "lastUpdatedBy": None, "lastUpdatedAt": None, "paramId": param_id, "userId": user_id})}
-
-            # Return the user's parameters with additional metadata
-            items = response.get("Items", [])
-            return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"parameters": items, "count": len(items)})}
-        else:
-            # Standard query by parameter ID when no user ID is specified
-            response = parameter_table.query(KeyConditionExpression=Key("paramId").eq(param_id), Limit=1, ScanIndexForward=False)
-
-            # Default values if no custom parameters exist
-            if not response.get("Items"):
-                return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"mean": 0, "stdDev": 1, "lastUpdatedBy": None, "lastUpdatedAt": None, "paramId": param_id})}
+        cache_key = (param_id, user_id)
+        cached = cache_get(cache_key)
+        if cached is None:
+            cached = load_parameters(param_id, user_id)
+            cache_put(cache_key, *cached)
 
-            # Return the current parameters
-            return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps(response["Items"][0])}
+        return build_response(event, *cached)
 
     except Exception as e:
         logger.error(f"Error getting visualization data: {str(e)}")
@@ -0,0 +1,133 @@
+import json
+import os
+import base64
+import binascii
+import logging
+from instrumentation import metrics
+from visualization import repository
+from visualization.repository import decimal_default
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("LIST_DEFAULT_PAGE_SIZE", "25"))
+MAX_PAGE_SIZE = int(os.environ.get("LIST_MAX_PAGE_SIZE", "100"))
+
+# Attributes clients may request through ?fields=
+PARAMETER_FIELDS = {"paramId", "timestamp", "mean", "stdDev", "lastUpdatedBy", "userId", "lastUpdatedAt", "title", "description", "version"}
+HISTORY_FIELDS = {"userId", "timestamp", "paramName", "paramId", "oldValue", "newValue", "userEmail"}
+
+# Parameter listings start after the head item (see updateVisualizationParams)
+FIRST_PARAMETER_TIMESTAMP = repository.HEAD_TIMESTAMP + 1
+
+
+class BadRequest(Exception):
+    pass
+
+
+def encode_cursor(last_evaluated_key):
+    """Opaque, URL-safe continuation token for a LastEvaluatedKey."""
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, default=decimal_default).encode()).decode()
+
+
+def decode_cursor(cursor, key_names):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise BadRequest("Invalid cursor") from e
+    if not isinstance(key, dict) or set(key) != key_names:
+        raise BadRequest("Invalid cursor")
+    return key
+
+
+def parse_int(query_params, name, default=None):
+    value = query_params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError as e:
+        raise BadRequest(f"{name} must be an integer") from e
+
+
+def build_query(query_params):
+    """Translate the query string into the repository to read and its query_page arguments."""
+    resource = query_params.get("resource", "params")
+    param_id = query_params.get("paramId")
+    user_id = query_params.get("userId")
+    param_name = query_params.get("paramName")
+
+    if resource == "params":
+        table, allowed = repository.parameters(), PARAMETER_FIELDS
+        if param_id:
+            index, hash_value = None, param_id
+        elif user_id:
+            index, hash_value = "UserIdIndex", user_id
+        else:
+            raise BadRequest("params listing requires paramId or userId")
+    elif resource == "history":
+        table, allowed = repository.history(), HISTORY_FIELDS
+        if param_id:
+            index, hash_value = "ParamIdIndex", param_id
+        elif param_name:
+            index, hash_value = "ParamNameIndex", param_name
+        elif user_id:
+            index, hash_value = None, user_id
+        else:
+            raise BadRequest("history listing requires paramId, paramName or userId")
+    else:
+        raise BadRequest("resource must be 'params' or 'history'")
+
+    # Time range on the timestamp sort key (milliseconds, inclusive)
+    start = parse_int(query_params, "from")
+    end = parse_int(query_params, "to")
+    if resource == "params":
+        start = max(start or 0, FIRST_PARAMETER_TIMESTAMP)
+
+    limit = min(max(parse_int(query_params, "limit", DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    kwargs = {"hash_value": hash_value, "index": index, "start": start, "end": end, "limit": limit, "ascending": query_params.get("order", "desc") == "asc"}
+
+    # Only read the requested attributes
+    fields = [field.strip() for field in query_params.get("fields", "").split(",") if field.strip()]
+    if fields:
+        unknown = set(fields) - allowed
+        if unknown:
+            raise BadRequest(f"Unknown fields: {', '.join(sorted(unknown))}")
+        kwargs["fields"] = fields
+
+    if query_params.get("cursor"):
+        kwargs["start_key"] = decode_cursor(query_params["cursor"], table.key_names(index))
+
+    return table, kwargs
+
+
+@metrics.handler("listVisualizationData")
+def lambda_handler(event, context):
+    """
+    Lists parameter sets or parameter change history one page at a time.
+
+    Query parameters:
+    - resource: "params" (default) or "history"
+    - paramId / userId / paramName: which partition or index to read
+    - from, to: inclusive timestamp range in milliseconds
+    - fields: comma-separated attributes to return
+    - limit: page size, capped at LIST_MAX_PAGE_SIZE
+    - order: "desc" (default, newest first) or "asc"
+    - cursor: nextCursor from the previous page
+    """
+    try:
+        query_params = event.get("queryStringParameters", {}) or {}
+        table, kwargs = build_query(query_params)
+
+        items, last_key = table.query_page(**kwargs)
+
+        return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"items": items, "count": len(items), "nextCursor": encode_cursor(last_key)}, default=decimal_default)}
+
+    except BadRequest as e:
+        return {"statusCode": 400, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": str(e)})}
+
+    except Exception as e:
+        logger.error(f"Error listing visualization data: {str(e)}")
+        return {"statusCode": 500, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": str(e)})}
@@ -0,0 +1,380 @@
+import os
+import time
+import threading
+import logging
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from instrumentation import metrics
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Connection pool shared by every thread of the container (broadcast fans out over up to
+# BROADCAST_MAX_WORKERS threads)
+MAX_POOL_CONNECTIONS = int(os.environ.get("DYNAMODB_MAX_POOL_CONNECTIONS", "32"))
+CLIENT_CONFIG = Config(max_pool_connections=MAX_POOL_CONNECTIONS, tcp_keepalive=True, connect_timeout=2, read_timeout=5, retries={"max_attempts": 3, "mode": "standard"})
+
+# "local" keeps every table in process memory, for tests and local runs
+BACKEND = os.environ.get("VIZ_REPOSITORY_BACKEND", "dynamodb")
+
+# Key schema of each table: environment variable holding its name, (hash, range) key and GSIs
+TABLES = {
+    "parameters": {"env": "PARAMETER_TABLE", "keys": ("paramId", "timestamp"), "indexes": {"UserIdIndex": ("userId", "timestamp")}},
+    "history": {"env": "HISTORY_TABLE", "keys": ("userId", "timestamp"), "indexes": {"ParamIdIndex": ("paramId", "timestamp"), "ParamNameIndex": ("paramName", "timestamp")}},
+    "connections": {"env": "CONNECTION_TABLE", "keys": ("connectionId", None), "indexes": {"UserConnectionsIndex": ("userId", "connectionId"), "ParamIdIndex": ("paramId", "connectionId")}},
+}
+
+# Sort key of the per-paramId head item holding the current version number and values.
+# It has no userId, so it stays out of UserIdIndex.
+HEAD_TIMESTAMP = 0
+
+BATCH_WRITE_LIMIT = 25
+# Cancellation reasons of a transaction that can succeed when it is simply sent again
+TRANSIENT_CANCELLATION_CODES = {"TransactionConflict", "ThrottlingError", "ProvisionedThroughputExceeded"}
+TRANSACT_ATTEMPTS = 4
+
+
+class ConflictError(Exception):
+    """A conditional write or transaction was rejected because its condition no longer holds.
+
+    ``failed`` holds the positions of the rejected operations within a transaction.
+    """
+
+    def __init__(self, message, failed=()):
+        super().__init__(message)
+        self.failed = tuple(failed)
+
+
+class HistoryKeyConflict(ConflictError):
+    """Only history rows were rejected: their (userId, timestamp) keys are already taken."""
+
+
+def decimal_default(value):
+    # DynamoDB returns numbers as Decimal, which json.dumps does not handle
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def to_decimal(value):
+    # DynamoDB rejects floats; go through str so 0.1 stays 0.1
+    return Decimal(str(value))
+
+
+class DynamoBackend:
+    """Table operations on a single low-level DynamoDB client, created on first use."""
+
+    def __init__(self):
+        self._client = None
+        self._lock = threading.Lock()
+        self._serializer = TypeSerializer()
+        self._deserializer = TypeDeserializer()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = boto3.client("dynamodb", config=CLIENT_CONFIG)
+        return self._client
+
+    def _call(self, operation, **kwargs):
+        with metrics.phase("call.dynamodb"):
+            return getattr(self.client, operation)(**kwargs)
+
+    def _dump(self, item):
+        return {name: self._serializer.serialize(value) for name, value in item.items()}
+
+    def _load(self, item):
+        return {name: self._deserializer.deserialize(value) for name, value in item.items()}
+
+    def _condition(self, condition, hash_key):
+        """ConditionExpression arguments for ("not_exists",) or ("equals", attribute, value)."""
+        if condition is None:
+            return {}
+        if condition[0] == "not_exists":
+            return {"ConditionExpression": "attribute_not_exists(#c)", "ExpressionAttributeNames": {"#c": hash_key}}
+        _, attribute, value = condition
+        return {"ConditionExpression": "#c = :c", "ExpressionAttributeNames": {"#c": attribute}, "ExpressionAttributeValues": {":c": self._serializer.serialize(value)}}
+
+    def get_item(self, table, key, consistent=False):
+        response = self._call("get_item", TableName=table["name"], Key=self._dump(key), ConsistentRead=consistent)
+        return self._load(response["Item"]) if "Item" in response else None
+
+    def put_item(self, table, item, condition=None):
+        try:
+            self._call("put_item", TableName=table["name"], Item=self._dump(item), **self._condition(condition, table["keys"][0]))
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                raise ConflictError(str(e)) from e
+            raise
+
+    def delete_item(self, table, key):
+        self._call("delete_item", TableName=table["name"], Key=self._dump(key))
+
+    def delete_items(self, table, keys):
+        for start in range(0, len(keys), BATCH_WRITE_LIMIT):
+            requests = [{"DeleteRequest": {"Key": self._dump(key)}} for key in keys[start : start + BATCH_WRITE_LIMIT]]
+            for attempt in range(5):
+                response = self._call("batch_write_item", RequestItems={table["name"]: requests})
+                requests = response.get("UnprocessedItems", {}).get(table["name"], [])
+                if not requests:
+                    break
+                time.sleep(0.05 * 2**attempt)
+            if requests:
+                logger.warning(f"{len(requests)} deletes left unprocessed in {table['name']}")
+
+    def query(self, table, hash_key, hash_value, range_key=None, start=None, end=None, index=None, limit=None, ascending=True, fields=None, start_key=None, consistent=False):
+        names = {"#h": hash_key}
+        values = {":h": self._serializer.serialize(hash_value)}
+        expression = "#h = :h"
+        if start is not None or end is not None:
+            names["#r"] = range_key
+            if start is not None and end is not None:
+                expression += " AND #r BETWEEN :lo AND :hi"
+            else:
+                expression += " AND #r >= :lo" if start is not None else " AND #r <= :hi"
+            if start is not None:
+                values[":lo"] = self._serializer.serialize(start)
+            if end is not None:
+                values[":hi"] = self._serializer.serialize(end)
+
+        kwargs = {"TableName": table["name"], "KeyConditionExpression": expression, "ExpressionAttributeValues": values, "ScanIndexForward": ascending}
+        if fields:
+            projected = {f"#f{i}": field for i, field in enumerate(fields)}
+            kwargs["ProjectionExpression"] = ", ".join(projected)
+            names.update(projected)
+        kwargs["ExpressionAttributeNames"] = names
+        if index:
+            kwargs["IndexName"] = index
+        if limit:
+            kwargs["Limit"] = limit
+        if start_key:
+            kwargs["ExclusiveStartKey"] = self._dump(start_key)
+        if consistent:
+            kwargs["ConsistentRead"] = True
+
+        response = self._call("query", **kwargs)
+        last_key = response.get("LastEvaluatedKey")
+        return [self._load(item) for item in response.get("Items", [])], self._load(last_key) if last_key else None
+
+    def transact_put(self, operations):
+        """Put every (table, item, condition) atomically; raises ConflictError if any condition fails.
+
+        Transactions cancelled only by contention or throttling are sent again with
+        backoff; any other cancellation is raised as the ClientError it is.
+        """
+        transact_items = [{"Put": {"TableName": table["name"], "Item": self._dump(item), **self._condition(condition, table["keys"][0])}} for table, item, condition in operations]
+        for attempt in range(TRANSACT_ATTEMPTS):
+            try:
+                self._call("transact_write_items", TransactItems=transact_items)
+                return
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+                codes = [reason.get("Code") for reason in e.response.get("CancellationReasons", [])]
+                reasons = set(codes)
+                if "ConditionalCheckFailed" in reasons:
+                    raise ConflictError(str(e), [position for position, code in enumerate(codes) if code == "ConditionalCheckFailed"]) from e
+                if attempt == TRANSACT_ATTEMPTS - 1 or not reasons & TRANSIENT_CANCELLATION_CODES:
+                    raise
+                time.sleep(0.05 * 2**attempt)
+
+
+class LocalBackend:
+    """In-memory stand-in for DynamoBackend with the same semantics for the operations used here."""
+
+    def __init__(self):
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def _rows(self, table):
+        return self.tables.setdefault(table["name"], {})
+
+    @staticmethod
+    def _key(table, item):
+        return tuple(item[name] for name in table["keys"] if name)
+
+    def _check(self, table, item, condition):
+        if condition is None:
+            return
+        current = self._rows(table).get(self._key(table, item))
+        if condition[0] == "not_exists":
+            if current is not None:
+                raise ConflictError(f"Item already exists in {table['name']}")
+        elif current is None or current.get(condition[1]) != condition[2]:
+            raise ConflictError(f"Condition on {condition[1]} failed in {table['name']}")
+
+    def get_item(self, table, key, consistent=False):
+        item = self._rows(table).get(self._key(table, key))
+        return dict(item) if item else None
+
+    def put_item(self, table, item, condition=None):
+        with self._lock:
+            self._check(table, item, condition)
+            self._rows(table)[self._key(table, item)] = dict(item)
+
+    def delete_item(self, table, key):
+        with self._lock:
+            self._rows(table).pop(self._key(table, key), None)
+
+    def delete_items(self, table, keys):
+        for key in keys:
+            self.delete_item(table, key)
+
+    def query(self, table, hash_key, hash_value, range_key=None, start=None, end=None, index=None, limit=None, ascending=True, fields=None, start_key=None, consistent=False):
+        key_names = [name for name in (hash_key, range_key, *table["keys"]) if name]
+        key_names = list(dict.fromkeys(key_names))
+        rows = [item for item in self._rows(table).values() if item.get(hash_key) == hash_value and (range_key is None or range_key in item)]
+        if start is not None:
+            rows = [item for item in rows if item[range_key] >= start]
+        if end is not None:
+            rows = [item for item in rows if item[range_key] <= end]
+        rows.sort(key=lambda item: tuple(item[name] for name in key_names[1:]), reverse=not ascending)
+
+        if start_key:
+            position = tuple(start_key[name] for name in key_names[1:])
+            rows = [item for item in rows if (tuple(item[name] for name in key_names[1:]) > position if ascending else tuple(item[name] for name in key_names[1:]) < position)]
+
+        last_key = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            last_key = {name: rows[-1][name] for name in key_names}
+        if fields:
+            rows = [{name: item[name] for name in fields if name in item} for item in rows]
+        return [dict(item) for item in rows], last_key
+
+    def transact_put(self, operations):
+        with self._lock:
+            failed = []
+            for position, (table, item, condition) in enumerate(operations):
+                try:
+                    self._check(table, item, condition)
+                except ConflictError:
+                    failed.append(position)
+            if failed:
+                raise ConflictError(f"Transaction cancelled, conditions failed at {failed}", failed)
+            for table, item, _ in operations:
+                self._rows(table)[self._key(table, item)] = dict(item)
+
+
+class TableRepository:
+    """Accessors for one table; the table name is read from its environment variable."""
+
+    def __init__(self, backend, spec):
+        self.backend = backend
+        self.table = {"name": os.environ.get(spec["env"]), "keys": spec["keys"]}
+        self.indexes = spec["indexes"]
+
+    def key_names(self, index=None):
+        """Attributes making up a LastEvaluatedKey when querying the table or ``index``."""
+        names = set(self.indexes[index]) if index else set()
+        return {name for name in (*names, *self.table["keys"]) if name}
+
+    def query_page(self, hash_value, index=None, start=None, end=None, limit=None, ascending=False, fields=None, start_key=None):
+        """One page of items for ``hash_value`` with an optional range on the sort key.
+        Returns ``(items, last_key)``; ``last_key`` is None on the final page."""
+        hash_key, range_key = self.indexes[index] if index else self.table["keys"]
+        return self.backend.query(self.table, hash_key, hash_value, range_key=range_key, start=start, end=end, index=index, limit=limit, ascending=ascending, fields=fields, start_key=start_key)
+
+
+class ParameterRepository(TableRepository):
+    def get_head(self, param_id, consistent=False):
+        return self.backend.get_item(self.table, {"paramId": param_id, "timestamp": HEAD_TIMESTAMP}, consistent=consistent)
+
+    def get_latest(self, param_id, consistent=False):
+        """Most recent parameter row, skipping the head item."""
+        items, _ = self.backend.query(self.table, "paramId", param_id, range_key="timestamp", start=HEAD_TIMESTAMP + 1, limit=1, ascending=False, consistent=consistent)
+        return items[0] if items else None
+
+    def list_for_user(self, user_id, limit):
+        items, _ = self.query_page(user_id, index="UserIdIndex", limit=limit)
+        return items
+
+    def commit_update(self, head, expected_version, parameter_item, history_items, history):
+        """
+        Write the head, the new parameter row and its history rows in one transaction.
+        The head is only replaced if its versionNumber is still ``expected_version``
+        (None: the head must not exist yet); otherwise ConflictError is raised.
+        """
+        head_condition = ("not_exists",) if expected_version is None else ("equals", "versionNumber", expected_version)
+        operations = [(self.table, head, head_condition), (self.table, parameter_item, ("not_exists",))]
+        operations.extend((history.table, item, ("not_exists",)) for item in history_items)
+        try:
+            self.backend.transact_put(operations)
+        except ConflictError as e:
+            # History keys are shared by all of a user's parameter sets, so a collision
+            # there is not a concurrent update of this one
+            if e.failed and min(e.failed) >= 2:
+                raise HistoryKeyConflict(str(e), e.failed) from e
+            raise
+
+
+class HistoryRepository(TableRepository):
+    def get_latest(self, user_id, consistent=False):
+        """Most recent history row of ``user_id``, across all parameter sets."""
+        items, _ = self.backend.query(self.table, "userId", user_id, range_key="timestamp", limit=1, ascending=False, consistent=consistent)
+        return items[0] if items else None
+
+
+class ConnectionRepository(TableRepository):
+    def put(self, item):
+        self.backend.put_item(self.table, item)
+
+    def get(self, connection_id):
+        return self.backend.get_item(self.table, {"connectionId": connection_id})
+
+    def delete(self, connection_id):
+        self.backend.delete_item(self.table, {"connectionId": connection_id})
+
+    def delete_many(self, connection_ids):
+        self.backend.delete_items(self.table, [{"connectionId": connection_id} for connection_id in connection_ids])
+
+    def subscriber_ids(self, param_id):
+        """IDs of the connections subscribed to ``param_id`` via the ParamIdIndex GSI."""
+        connection_ids, start_key = [], None
+        while True:
+            items, start_key = self.query_page(param_id, index="ParamIdIndex", ascending=True, fields=["connectionId"], start_key=start_key)
+            connection_ids.extend(item["connectionId"] for item in items)
+            if start_key is None:
+                return connection_ids
+
+
+_backend = None
+_repositories = {}
+_lock = threading.RLock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                _backend = LocalBackend() if BACKEND == "local" else DynamoBackend()
+    return _backend
+
+
+def _repository(name, cls):
+    repository = _repositories.get(name)
+    if repository is None:
+        with _lock:
+            repository = _repositories.get(name)
+            if repository is None:
+                repository = _repositories[name] = cls(get_backend(), TABLES[name])
+    return repository
+
+
+def parameters():
+    return _repository("parameters", ParameterRepository)
+
+
+def history():
+    return _repository("history", HistoryRepository)
+
+
+def connections():
+    return _repository("connections", ConnectionRepository)
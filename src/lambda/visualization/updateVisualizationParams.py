@@ -3,23 +3,66 @@ import boto3
 import time
 import os
 import logging
-from boto3.dynamodb.conditions import Key
+from decimal import Decimal
+from instrumentation import metrics
+from visualization import repository
+from visualization.broadcast import deliver_job, get_broadcast_queue
+from visualization.repository import ConflictError, HistoryKeyConflict, to_decimal
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-parameter_table = dynamodb.Table(os.environ.get("PARAMETER_TABLE"))
-history_table = dynamodb.Table(os.environ.get("HISTORY_TABLE"))
-connection_table = dynamodb.Table(os.environ.get("CONNECTION_TABLE"))
+# "async" hands broadcasts to the broadcastParams Lambda through a queue instead of
+# pushing them inside the request; "local" keeps them in an in-process queue for local runs
+BROADCAST_MODE = os.environ.get("BROADCAST_MODE", "sync")
+broadcast_queue = get_broadcast_queue(BROADCAST_MODE)
+# Commits retried with later timestamps when only their history keys were taken
+HISTORY_KEY_ATTEMPTS = int(os.environ.get("HISTORY_KEY_ATTEMPTS", "3"))
 
-# Optional: WebSocket API client for real-time updates
+# Optional: WebSocket API client for real-time updates, only needed when pushing in-request
 apigw_management = None
-if os.environ.get("WEBSOCKET_API_ENDPOINT"):
+if os.environ.get("WEBSOCKET_API_ENDPOINT") and broadcast_queue is None:
     endpoint = os.environ.get("WEBSOCKET_API_ENDPOINT")
     apigw_management = boto3.client("apigatewaymanagementapi", endpoint_url=endpoint)
 
 
+def read_current_params(param_id):
+    """
+    Read the current values and version number of a parameter set from its head item.
+    Parameter sets written before head items existed fall back to their latest row.
+    ``nextTimestamp`` is the first timestamp the next update may use.
+    """
+    parameters = repository.parameters()
+    head = parameters.get_head(param_id, consistent=True)
+    if head:
+        return {"exists": True, "headExists": True, "versionNumber": int(head["versionNumber"]), "version": f"v{int(head['versionNumber'])}", "mean": head["mean"], "stdDev": head["stdDev"], "nextTimestamp": int(head["nextTimestamp"])}
+
+    current = {"exists": False, "headExists": False, "versionNumber": 0, "version": None, "mean": Decimal(0), "stdDev": Decimal(1), "nextTimestamp": 0}
+    item = parameters.get_latest(param_id, consistent=True)
+    if item:
+        version = item.get("version", "v0")
+        # Those updates wrote their history rows at timestamp and timestamp + 1
+        current.update(exists=True, mean=item.get("mean", Decimal(0)), stdDev=item.get("stdDev", Decimal(1)), version=version, nextTimestamp=int(item["timestamp"]) + 2)
+        if version.startswith("v") and version[1:].isdigit():
+            current["versionNumber"] = int(version[1:])
+    return current
+
+
+def commit_update(param_id, current, version_number, parameter_item, history_items):
+    """
+    Write the new parameter row, the head item and the history rows in a single
+    transaction. The head item's version number is the concurrency guard: if another
+    writer advanced it since it was read, ConflictError is raised and nothing is written.
+    The history rows take one millisecond each from the parameter row's timestamp on;
+    the head records where the next update has to start.
+    """
+    next_timestamp = parameter_item["timestamp"] + max(1, len(history_items))
+    head = {"paramId": param_id, "timestamp": repository.HEAD_TIMESTAMP, "versionNumber": version_number, "mean": parameter_item["mean"], "stdDev": parameter_item["stdDev"], "lastUpdatedAt": parameter_item["timestamp"], "nextTimestamp": next_timestamp}
+    expected_version = current["versionNumber"] if current["headExists"] else None
+    repository.parameters().commit_update(head, expected_version, parameter_item, history_items, repository.history())
+
+
+@metrics.handler("updateVisualizationParams")
 def lambda_handler(event, context):
     """
     Updates normal distribution parameters and records the change history.
@@ -52,87 +95,81 @@ def lambda_handler(event, context):
     if new_std_dev <= 0:
         return {"statusCode": 400, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": "Standard deviation must be positive"})}
 
+    # Optional optimistic concurrency: reject the update if the stored version moved on
+    expected_version = body.get("expectedVersion")
+
     try:
-        # Get current params for history tracking
-        current_params = parameter_table.query(KeyConditionExpression=Key("paramId").eq(param_id), Limit=1, ScanIndexForward=False)
-
-        current_mean = 0
-        current_std_dev = 1
-        param_exists = False
-
-        if current_params.get("Items"):
-            param_exists = True
-            current_mean = current_params["Items"][0].get("mean", 0)
-            current_std_dev = current_params["Items"][0].get("stdDev", 1)
-
-        timestamp = int(time.time() * 1000)  # Milliseconds since epoch
-
-        # Build updated parameter item
-        parameter_item = {"paramId": param_id, "timestamp": timestamp, "mean": new_mean, "stdDev": new_std_dev, "lastUpdatedBy": user_email, "userId": user_id, "lastUpdatedAt": timestamp, "title": title, "description": description}
-
-        # Add unique version identifier for tracking
-        if not param_exists:
-            # For new parameter sets, create a version identifier
-            parameter_item["version"] = "v1"
-        else:
-            # For updates, increment the version
-            current_version = current_params["Items"][0].get("version", "v0")
-            if current_version.startswith("v"):
-                try:
-                    version_num = int(current_version[1:])
-                    parameter_item["version"] = f"v{version_num + 1}"
-                except ValueError:
-                    parameter_item["version"] = "v1"
-            else:
-                parameter_item["version"] = "v1"
+        current = read_current_params(param_id)
 
-        # Update the parameters
-        parameter_table.put_item(Item=parameter_item)
+        if expected_version is not None and expected_version != current["version"]:
+            return {"statusCode": 409, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": "Version conflict", "paramId": param_id, "currentVersion": current["version"]})}
 
-        # Record change history with paramId
-        if new_mean != current_mean:
-            history_item = {"userId": user_id, "timestamp": timestamp, "paramName": "mean", "paramId": param_id, "oldValue": current_mean, "newValue": new_mean, "userEmail": user_email}
-            history_table.put_item(Item=history_item)
+        # Milliseconds since epoch, but never before the keys taken by the previous update
+        timestamp = max(int(time.time() * 1000), current["nextTimestamp"])
+        version_number = current["versionNumber"] + 1
 
-        if new_std_dev != current_std_dev:
-            history_item = {"userId": user_id, "timestamp": timestamp + 1, "paramName": "stdDev", "paramId": param_id, "oldValue": current_std_dev, "newValue": new_std_dev, "userEmail": user_email}  # Ensure unique timestamp
-            history_table.put_item(Item=history_item)
+        # Record change history with paramId
+        changes = []
+        if to_decimal(new_mean) != current["mean"]:
+            changes.append(("mean", current["mean"], to_decimal(new_mean)))
+
+        if to_decimal(new_std_dev) != current["stdDev"]:
+            changes.append(("stdDev", current["stdDev"], to_decimal(new_std_dev)))
+
+        try:
+            for attempt in range(HISTORY_KEY_ATTEMPTS):
+                # Build updated parameter item
+                parameter_item = {"paramId": param_id, "timestamp": timestamp, "mean": to_decimal(new_mean), "stdDev": to_decimal(new_std_dev), "lastUpdatedBy": user_email, "userId": user_id, "lastUpdatedAt": timestamp, "title": title, "description": description, "version": f"v{version_number}"}
+                history_items = [{"userId": user_id, "timestamp": timestamp + offset, "paramName": name, "paramId": param_id, "oldValue": old_value, "newValue": new_value, "userEmail": user_email} for offset, (name, old_value, new_value) in enumerate(changes)]
+                try:
+                    commit_update(param_id, current, version_number, parameter_item, history_items)
+                    break
+                except HistoryKeyConflict as e:
+                    if attempt == HISTORY_KEY_ATTEMPTS - 1:
+                        raise
+                    # The same user's update of another parameter set took these history keys
+                    logger.warning(f"History keys taken for {param_id} at {timestamp}, retrying: {str(e)}")
+                    latest = repository.history().get_latest(user_id, consistent=True)
+                    timestamp = max(timestamp + len(history_items), int(latest["timestamp"]) + 1 if latest else 0)
+        except ConflictError as e:
+            # Another writer committed first; nothing was written
+            logger.warning(f"Concurrent update detected for {param_id}: {str(e)}")
+            return {"statusCode": 409, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": "Version conflict", "paramId": param_id, "currentVersion": read_current_params(param_id)["version"]})}
 
         # Broadcast to all connected clients if WebSocket API is configured
-        if apigw_management:
-            broadcast_params_update(param_id, new_mean, new_std_dev, user_email, user_id)
+        broadcast_stats = None
+        if broadcast_queue is not None:
+            broadcast_stats = queue_params_update(param_id, new_mean, new_std_dev, user_email, user_id, timestamp, parameter_item["version"])
+        elif apigw_management:
+            broadcast_stats = broadcast_params_update(param_id, new_mean, new_std_dev, user_email, user_id)
 
-        return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"success": True, "timestamp": timestamp, "paramId": param_id, "version": parameter_item["version"]})}
+        return {"statusCode": 200, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"success": True, "timestamp": timestamp, "paramId": param_id, "version": parameter_item["version"], "broadcast": broadcast_stats})}
 
     except Exception as e:
         logger.error(f"Error updating parameters: {str(e)}")
         return {"statusCode": 500, "headers": {"Access-Control-Allow-Origin": "*", "Content-Type": "application/json"}, "body": json.dumps({"error": str(e)})}
 
 
+def queue_params_update(param_id, mean, std_dev, updated_by, user_id, timestamp, version):
+    """Hand a parameter update to the broadcaster Lambda; the update is already committed, so failures are only logged"""
+    try:
+        broadcast_queue.send({"paramId": param_id, "mean": mean, "stdDev": std_dev, "updatedBy": updated_by, "userId": user_id, "timestamp": timestamp, "version": version})
+        return {"queued": True}
+
+    except Exception as e:
+        logger.error(f"Error queueing broadcast: {str(e)}")
+        return None
+
+
 def broadcast_params_update(param_id, mean, std_dev, updated_by, user_id):
-    """Broadcast parameter updates to all connected WebSocket clients"""
+    """Broadcast parameter updates to the WebSocket clients subscribed to param_id"""
     if not apigw_management:
-        return
+        return None
 
     try:
-        # Get all connection IDs
-        response = connection_table.scan(ProjectionExpression="connectionId,userId")
-
-        message = json.dumps({"type": "PARAMS_UPDATE", "data": {"paramId": param_id, "mean": mean, "stdDev": std_dev, "updatedBy": updated_by, "userId": user_id, "timestamp": int(time.time() * 1000)}})
-
-        # Send to each connection
-        for item in response.get("Items", []):
-            connection_id = item["connectionId"]
-            try:
-                apigw_management.post_to_connection(ConnectionId=connection_id, Data=message)
-                logger.info(f"Successfully sent update to connection {connection_id}")
-            except Exception as e:
-                # Connection is no longer valid, delete it
-                if "GoneException" in str(e):
-                    logger.info(f"Removing stale connection: {connection_id}")
-                    connection_table.delete_item(Key={"connectionId": connection_id})
-                else:
-                    logger.error(f"Error posting to connection {connection_id}: {str(e)}")
+        job = {"paramId": param_id, "mean": mean, "stdDev": std_dev, "updatedBy": updated_by, "userId": user_id}
+        return deliver_job(apigw_management, repository.connections(), job)
 
     except Exception as e:
         logger.error(f"Error broadcasting update: {str(e)}")
+        return None
@@ -1,16 +1,14 @@
-import boto3
-import os
 import time
 import logging
 import json
+from instrumentation import metrics
+from visualization import repository
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-connection_table = dynamodb.Table(os.environ.get("CONNECTION_TABLE"))
-
 
+@metrics.handler("wsConnect")
 def lambda_handler(event, context):
     """Handle WebSocket connect event"""
     connection_id = event["requestContext"]["connectionId"]
@@ -27,6 +25,9 @@ def lambda_handler(event, context):
     # Get userId from query parameters or default to anonymous
     user_id = query_params.get("userId", "anonymous")
 
+    # Parameter set this connection subscribes to (indexed by ParamIdIndex for targeted broadcasts)
+    param_id = query_params.get("paramId", "normal_distribution_params")
+
     current_time = int(time.time())
     timestamp_ms = current_time * 1000
 
@@ -35,10 +36,10 @@ def lambda_handler(event, context):
         expiry = current_time + 86400
 
         # Create connection record with enhanced attributes
-        connection_item = {"connectionId": connection_id, "userId": user_id, "connectedAt": timestamp_ms, "expiry": expiry, "connectionStatus": "connected", "clientIp": source_ip}
+        connection_item = {"connectionId": connection_id, "userId": user_id, "paramId": param_id, "connectedAt": timestamp_ms, "expiry": expiry, "connectionStatus": "connected", "clientIp": source_ip}
 
         # Store connection in DynamoDB
-        connection_table.put_item(Item=connection_item)
+        repository.connections().put(connection_item)
 
         logger.info(f"WebSocket connected: {json.dumps(connection_item)}")
         return {"statusCode": 200, "body": "Connected"}
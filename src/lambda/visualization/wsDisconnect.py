@@ -1,28 +1,27 @@
-import boto3
-import os
 import logging
+from instrumentation import metrics
+from visualization import repository
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-connection_table = dynamodb.Table(os.environ.get("CONNECTION_TABLE"))
-
 
+@metrics.handler("wsDisconnect")
 def lambda_handler(event, context):
     """Handle WebSocket disconnect event"""
     connection_id = event["requestContext"]["connectionId"]
 
     try:
+        connections = repository.connections()
+
         # Get the connection record to log details before deletion
-        connection_response = connection_table.get_item(Key={"connectionId": connection_id})
+        connection_data = connections.get(connection_id)
 
-        if "Item" in connection_response:
-            connection_data = connection_response["Item"]
+        if connection_data:
             logger.info(f"Disconnecting user: {connection_data.get('userId', 'unknown')} with connection ID: {connection_id}")
 
             # Option 1: Delete the connection record
-            connection_table.delete_item(Key={"connectionId": connection_id})
+            connections.delete(connection_id)
 
             # Option 2 (alternative): Mark connection as disconnected but let TTL expire it
             # This would be useful for analytics on connection durations
@@ -38,7 +37,7 @@ def lambda_handler(event, context):
         else:
             logger.warning(f"Connection ID not found: {connection_id}")
             # Still attempt to delete in case it exists
-            connection_table.delete_item(Key={"connectionId": connection_id})
+            connections.delete(connection_id)
 
         return {"statusCode": 200, "body": "Disconnected"}
     except Exception as e: